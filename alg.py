@@ -1,10 +1,13 @@
-import datetime
+import collections.abc
+import logging
+import os
 import typing
 
 import numpy as np
 from matplotlib import pyplot as plt
 
-from market import Market, Stock
+from alg_log import LogWriter
+from market import Market, Stock, downsample_series, rolling_average
 
 
 # transaction_cost = lambda price: price*0.1
@@ -12,22 +15,161 @@ def transaction_cost(price):
 	return 1
 
 
+def round_2(x: np.ndarray) -> np.ndarray:
+	"""round(v, 2) of every element: np.round can differ from the builtin on values close to a half cent"""
+	rounded = np.round(x, 2)
+	near_half = np.abs(np.abs(x * 100) % 1 - 0.5) < 1e-6
+	if near_half.any():
+		rounded[near_half] = [round(v, 2) for v in x[near_half].tolist()]
+	return rounded
+
+
+def next_true(mask: np.ndarray) -> np.ndarray:
+	"""for every index i the first j >= i with mask[j], len(mask) if there is none. has len(mask) + 1 elements"""
+	idx = np.where(mask, np.arange(len(mask)), len(mask))
+	return np.append(np.minimum.accumulate(idx[::-1])[::-1], len(mask))
+
+
+class Portfolio(collections.abc.MutableMapping):
+	"""dict-like name -> quantity view over a holdings array, in the order of the stocks of the market"""
+
+	def __init__(self, market: Market, holdings: np.ndarray):
+		self.market = market
+		self.holdings = holdings
+
+	def __getitem__(self, name: str) -> int:
+		return self.holdings.item(self.market.stock_index[name])
+
+	def __setitem__(self, name: str, n: int) -> None:
+		self.holdings[self.market.stock_index[name]] = n
+
+	def __delitem__(self, name: str) -> None:
+		raise TypeError("stocks can't be removed from a portfolio")
+
+	def __iter__(self) -> typing.Iterator[str]:
+		return (stock.name for stock in self.market.stocks)
+
+	def __len__(self) -> int:
+		return len(self.holdings)
+
+	def __repr__(self) -> str:
+		return repr(dict(self))
+
+
+class TradeLedger:
+	"""
+	columnar record of the trades: one row of the structured array records per trade, in the order they happened.
+	stock is the index of the stock in names, cash is the capital after the trade
+	"""
+	dtype = np.dtype([('tick', np.int64), ('stock', np.int32), ('bought', np.int64), ('sold', np.int64), ('price', np.float64), ('cash', np.float64)])
+
+	def __init__(self, names: list[str], capacity: int = 64):
+		self.names: list[str] = list(names)
+		self.rows: np.ndarray = np.zeros(max(1, capacity), dtype=self.dtype)
+		self.n = 0
+
+	def append(self, tick: int, stock: int, bought: int, sold: int, price: float, cash: float) -> None:
+		if self.n == len(self.rows):
+			self.rows = np.resize(self.rows, 2 * len(self.rows))
+		self.rows[self.n] = tick, stock, bought, sold, price, cash
+		self.n += 1
+
+	def extend(self, tick: np.ndarray, stock: np.ndarray, bought: np.ndarray, sold: np.ndarray, price: np.ndarray, cash: np.ndarray) -> None:
+		"""append of every element of the arrays, in their order"""
+		n = self.n + len(tick)
+		if n > len(self.rows):
+			rows = np.zeros(max(n, 2 * len(self.rows)), dtype=self.dtype)
+			rows[:self.n] = self.rows[:self.n]
+			self.rows = rows
+		for column, values in zip(('tick', 'stock', 'bought', 'sold', 'price', 'cash'), (tick, stock, bought, sold, price, cash)):
+			self.rows[column][self.n:n] = values
+		self.n = n
+
+	@property
+	def records(self) -> np.ndarray:
+		return self.rows[:self.n]
+
+	def __len__(self) -> int:
+		return self.n
+
+	def __eq__(self, other) -> bool:
+		return isinstance(other, TradeLedger) and self.names == other.names and np.array_equal(self.records, other.records)
+
+	def __getstate__(self) -> dict:
+		# only the filled rows are pickled
+		return {'names': self.names, 'records': self.records.copy()}
+
+	def __setstate__(self, state: dict) -> None:
+		self.names = state['names']
+		self.rows = state['records'] if len(state['records']) > 0 else np.zeros(1, dtype=self.dtype)
+		self.n = len(state['records'])
+
+	def to_dict(self) -> dict[str: dict[int: tuple[int, int]]]:
+		"""the moves as {stock name: {tick: (bought, sold)}}"""
+		moves = {name: dict() for name in self.names}
+		for tick, stock, bought, sold in zip(*(self.records[c].tolist() for c in ('tick', 'stock', 'bought', 'sold'))):
+			moves[self.names[stock]][tick] = bought, sold
+		return moves
+
+
+class CapitalHistory:
+	"""tick, capital and tot capital of every update, in arrays preallocated for capacity updates"""
+
+	def __init__(self, capacity: int, start_capital: float):
+		self.data: np.ndarray = np.zeros((3, max(2, capacity)), dtype=np.float64)
+		self.n = 0
+		self.append(0, start_capital, start_capital)
+
+	def append(self, tick: int, capital: float, tot_capital: float) -> None:
+		if self.n == self.data.shape[1]:
+			self.data = np.concatenate((self.data, np.zeros(self.data.shape)), axis=1)
+		self.data[:, self.n] = tick, capital, tot_capital
+		self.n += 1
+
+	def extend(self, ticks: np.ndarray, capital: np.ndarray, tot_capital: np.ndarray) -> None:
+		n = self.n + len(ticks)
+		if n > self.data.shape[1]:
+			self.data = np.concatenate((self.data, np.zeros((3, max(n, 2 * self.data.shape[1]) - self.data.shape[1]))), axis=1)
+		self.data[:, self.n:n] = ticks, capital, tot_capital
+		self.n = n
+
+	@property
+	def ticks(self) -> np.ndarray:
+		return self.data[0, :self.n]
+
+	@property
+	def capital(self) -> np.ndarray:
+		return self.data[1, :self.n]
+
+	@property
+	def tot_capital(self) -> np.ndarray:
+		return self.data[2, :self.n]
+
+	def __getstate__(self) -> dict:
+		return {'data': self.data[:, :self.n].copy()}
+
+	def __setstate__(self, state: dict) -> None:
+		self.data = state['data']
+		self.n = self.data.shape[1]
+
+
 class AlgorithmStrategy:
 	def __init__(self, market: Market, alg_name: str = "base_alg", start_capital: float = 10000):
 		self.name = alg_name
 		self.market: Market = market
-		self.portfolio: dict = {stock.name: 0 for stock in self.market.stocks}
+		self.holdings: np.ndarray = np.zeros(len(self.market.stocks), dtype=np.int64)
+		self.portfolio: Portfolio = Portfolio(self.market, self.holdings)
 		self.capital: float = start_capital
 		self.start_capital = start_capital
 		self.tick_count = 0
-		self.capital_history: list = [[0], [start_capital], [start_capital]]
+		# one update per tick at most, plus the first and the last one
+		history_capacity = len(self.market.stocks[0].past) + 2 if len(self.market.stocks) > 0 else 0
+		self.capital_history: CapitalHistory = CapitalHistory(history_capacity, start_capital)
 		self.log_disabled = False
-		self.log_file = None
+		self.log_level = logging.DEBUG
+		self.log_writer: LogWriter | None = None
 		self.n_tran = 0
-		self.moves: dict[str: dict[int: tuple[int, int]]] = {stock.name: dict() for stock in self.market.stocks}
-
-		if not self.log_disabled:
-			self.open_log()
+		self.moves: TradeLedger = TradeLedger([stock.name for stock in self.market.stocks])
 
 	def disable_log(self) -> None:
 		if not self.log_disabled:
@@ -43,64 +185,176 @@ class AlgorithmStrategy:
 		for stock in self.market.stocks:
 			to_buy, to_sell = self.buy_sell(stock)
 			if to_buy + to_sell > 0:
-				self.moves[stock.name][self.tick_count] = to_buy, to_sell
-				self.n_tran += to_buy + to_sell
+				self.trade(stock, to_buy, to_sell)
 				capital_changed = True
-				if to_buy > 0:
-					self.portfolio[stock.name] += to_buy
-					self.capital -= (stock.price() * to_buy) + transaction_cost(stock.price())
-					self.log(f"buy {to_buy} {stock.name} @ {stock.price()}")
+		if capital_changed:
+			self.update_history()
 
-				if self.portfolio[stock.name] < to_buy:
-					raise Exception("not enough stocks in portfolio")
+	def trade(self, stock: Stock, to_buy: int, to_sell: int) -> None:
+		i = self.market.stock_index[stock.name]
+		price = stock.settle_price()
+		self.n_tran += to_buy + to_sell
+		if to_buy > 0:
+			self.holdings[i] += to_buy
+			self.capital -= (price * to_buy) + transaction_cost(price)
+			self.log("buy %d %s @ %s", to_buy, stock.name, price)
 
-				if to_sell > 0:
-					self.portfolio[stock.name] -= to_sell
-					self.capital += (stock.price() * to_sell) - transaction_cost(stock.price())
-					self.log(f"sell {to_sell} {stock.name} @ {stock.price()}")
+		if self.holdings[i] < to_buy:
+			raise Exception("not enough stocks in portfolio")
 
-				self.capital = round(self.capital, 2)
+		if to_sell > 0:
+			self.holdings[i] -= to_sell
+			self.capital += (price * to_sell) - transaction_cost(price)
+			self.log("sell %d %s @ %s", to_sell, stock.name, price)
 
-				self.log(f"\tportfolio: {self.portfolio}")
-				self.log(f"\tcapital: {self.capital}")
-		if capital_changed:
-			self.update_history()
+		self.capital = round(self.capital, 2)
+		self.moves.append(self.tick_count, i, to_buy, to_sell, price, self.capital)
+
+		if not self.log_disabled:
+			# the record is formatted later by the writer thread, so it gets a copy of the holdings
+			self.log("\tportfolio: %s", Portfolio(self.market, self.holdings.copy()), level=logging.DEBUG)
+			self.log("\tcapital: %s", self.capital, level=logging.DEBUG)
+
+	def replay(self, trades: np.ndarray, settle: np.ndarray) -> None:
+		"""
+		the trades of vectorized_moves, (stock, tick, to_buy, to_sell) rows sorted by tick and stock, applied with array
+		operations: the same holdings, capital, history and ledger as trade() for every row and update_history() after
+		every tick, without the log. a trade at tick t is settled at settle[:, t - 1].
+		the capital is summed in integer cents, the trades ending within rounding error of a half cent are computed one at
+		a time like trade(), where the rounding of the float capital depends on its value
+		"""
+		if len(trades) == 0:
+			return
+		stock, tick, to_buy, to_sell = np.asarray(trades, dtype=np.int64).T
+		price = settle[stock, tick - 1]
+
+		# holdings of the stock of every trade before it: the changes of each stock summed in their order
+		order = np.argsort(stock, kind="stable")
+		change = (to_buy - to_sell)[order]
+		summed = np.cumsum(change)
+		firsts = np.flatnonzero(np.append(True, stock[order][1:] != stock[order][:-1]))
+		before = np.empty(len(trades), dtype=np.int64)
+		before[order] = self.holdings[stock[order]] + summed - change - np.repeat(summed[firsts] - change[firsts], np.diff(np.append(firsts, len(order))))
+		if (before < 0).any():
+			raise Exception("not enough stocks in portfolio")
+
+		spent = np.where(to_buy > 0, (price * to_buy) + transaction_cost(price), 0.0)
+		earned = np.where(to_sell > 0, (price * to_sell) - transaction_cost(price), 0.0)
+		delta = (earned - spent) * 100
+		# an upper bound of the float error of the capital, in cents
+		error = 1e-6 + 1e-12 * (abs(self.capital) + np.cumsum(spent + np.abs(earned)))
+		exact = np.flatnonzero(np.abs(np.abs(delta) % 1 - 0.5) < error)
+		# cents[0] is the capital after the first trade, computed from the start capital
+		cents = np.rint(delta).astype(np.int64)
+		capital, last, done = self.capital, 0, 0
+		for j in ([0] if len(exact) == 0 or exact[0] != 0 else []) + exact.tolist():
+			if j > 0:
+				last += int(cents[done:j].sum())
+				capital = last / 100
+			if to_buy[j] > 0:
+				capital -= spent[j].item()
+			if to_sell[j] > 0:
+				capital += earned[j].item()
+			cents[j] = round(round(capital, 2) * 100) - last
+			last, done = last + int(cents[j]), j + 1
+		cash = np.cumsum(cents) / 100
+
+		# one history update per tick, after its last trade, with the holdings at that tick
+		ends = np.flatnonzero(np.append(tick[1:] != tick[:-1], True))
+		holdings = np.zeros((len(ends), len(self.holdings)), dtype=np.int64)
+		np.add.at(holdings, (np.cumsum(np.append(0, tick[1:] != tick[:-1])), stock), to_buy - to_sell)
+		holdings = self.holdings + np.cumsum(holdings, axis=0)
+		tot_stock_value = round_2(np.array([
+			np.dot(np.ascontiguousarray(settle[:, t - 1]), h) for t, h in zip(tick[ends].tolist(), holdings)
+			], dtype=np.float64))
+		self.capital_history.extend(tick[ends], cash[ends], round_2(cash[ends] + tot_stock_value))
+
+		self.moves.extend(tick, stock, to_buy, to_sell, price, cash)
+		self.holdings[:] = holdings[-1]
+		self.capital = cash[-1].item()
+		self.n_tran += int((to_buy + to_sell).sum())
+		self.tick_count = tick[-1].item()
+
+	@classmethod
+	def vectorized_moves(cls, prices: np.ndarray, start: int, params: list) -> list[np.ndarray]:
+		"""
+		computes the moves of the whole benchmark with array operations instead of ticking.
+		prices has one row per stock, the strategy ticks with end_index from start to prices.shape[1] - 2.
+		returns, for every stock, an (n, 3) int array of (tick, to_buy, to_sell) rows
+		"""
+		raise NotImplementedError()
+
+	@classmethod
+	def batched_params(cls, batch: "BatchedAlgorithm", params: np.ndarray) -> None:
+		"""
+		reads the params rows into batch: the n_stock_mov, buy_perc, sell_perc and time_comp arrays of read_params,
+		and the rolling averages of every distinct time_comp
+		"""
+		read = [cls.read_params(list(p)) for p in params]
+		batch.n_stock_mov = np.array([r[0] for r in read], dtype=np.int64)
+		batch.buy_perc = np.array([r[1] for r in read], dtype=np.float64)
+		batch.sell_perc = np.array([r[2] for r in read], dtype=np.float64)
+		batch.time_comp = np.array([r[3] for r in read], dtype=np.int64)
+
+		# one rolling average per distinct time_comp, shared by all the rows using it
+		time_comps, batch.time_comp_i = np.unique(batch.time_comp, return_inverse=True)
+		batch.averages = np.array([[rolling_average(past, batch.ends, from_time=int(tc)) for past in batch.prices] for tc in time_comps])
+
+	@classmethod
+	def batched_setup(cls, batch: "BatchedAlgorithm") -> None:
+		pass
+
+	@classmethod
+	def batched_buy_sell(cls, batch: "BatchedAlgorithm", stock_i: int) -> tuple[np.ndarray, np.ndarray]:
+		"""buy_sell for every params row of batch at its current tick, returns the to_buy and to_sell arrays"""
+		raise NotImplementedError()
 
 	def update_history(self) -> None:
-		self.capital_history[0].append(self.tick_count)
-		self.capital_history[1].append(self.capital)
-		self.capital_history[2].append(self.tot_capital())
+		self.capital_history.append(self.tick_count, self.capital, self.tot_capital())
+
+	def log_path(self) -> str:
+		return f"./logs/{self.name}.log"
 
 	def open_log(self) -> None:
-		self.log_file = open(f"./logs/{self.name}.log", "a+")
+		if self.log_writer is None:
+			self.log_writer = LogWriter.acquire(self.log_path())
 
 	def close_log(self) -> None:
-		self.log_file.close()
-		self.log_file = None
+		if self.log_writer is not None:
+			self.log_writer.release()
+			self.log_writer = None
 
-	def log(self, log: str) -> None:
-		if self.log_disabled:
+	def log(self, log: str, *args, level: int = logging.INFO) -> None:
+		"""log % args, formatted and written by a background thread. nothing is done when the log is disabled"""
+		if self.log_disabled or level < self.log_level:
 			return
-
-		t = datetime.datetime.now().strftime("%Y/%m/%d_%H:%M:%S.%f") + f" tick{self.tick_count}\t"
-		self.log_file.write(t + log + "\n")
+		if self.log_writer is None:
+			self.open_log()
+		self.log_writer.write(self.tick_count, log, args)
 
 	def clear_log(self) -> None:
-		open(f"./logs/{self.name}.log", "w").close()
+		if os.path.exists(self.log_path()):
+			open(self.log_path(), "w").close()
 
 	def tot_stock_value(self) -> float:
-		return round(sum([self.market.stock_by_name(name).price() * n for name, n in self.portfolio.items()]), 2)
+		return round(float(np.dot(self.market.settle_prices(), self.holdings)), 2)
 
 	def tot_capital(self) -> float:
 		return round(self.capital + self.tot_stock_value(), 2)
 
+	def max_drawdown(self) -> float:
+		"""largest fall of the tot capital from a previous peak"""
+		tot_capital = self.capital_history.tot_capital
+		return round(float((np.maximum.accumulate(tot_capital) - tot_capital).max()), 2)
+
 	def stats(self) -> dict[str: typing.Any]:
 		return {
 			'name': self.name,
 			'n transactions': self.n_tran,
-			'max capital': max(self.capital_history[1]),
-			'min capital': min(self.capital_history[1]),
-			'final portfolio': self.portfolio,
+			'max capital': float(self.capital_history.capital.max()),
+			'min capital': float(self.capital_history.capital.min()),
+			'max drawdown': self.max_drawdown(),
+			'final portfolio': dict(self.portfolio),
 			'liquid': self.capital,
 			'tot stock value': self.tot_stock_value(),
 			'tot capital': self.tot_capital(),
@@ -117,16 +371,24 @@ class AlgorithmStrategy:
 		for k, v in stats.items():
 			print(f"{k}: {v}")
 
-	def gen_fig(self, fig_index=0) -> plt.Figure:
+	def gen_fig(self, fig_index=0, fig: plt.Figure = None, downsample: str = None, n_points: int = 2000) -> plt.Figure:
+		"""
+		the prices of the stocks and the capital. drawn on fig when given, otherwise on the pyplot figure fig_index.
+		with downsample (a key of market.downsamplers) every series is reduced to about n_points
+		"""
 		t = np.arange(0, self.market.history_len())
 
-		fig = plt.figure(fig_index)
+		if fig is None:
+			fig = plt.figure(fig_index)
 		fig.suptitle(self.name)
 		axs = fig.subplots(2)
 		for s in self.market.stocks:
-			axs[0].plot(t, s.past, label=s.name)
-		axs[1].plot(self.capital_history[0], self.capital_history[1], 'o-', label="capital")
-		axs[1].plot(self.capital_history[0], self.capital_history[2], 'o-', label="tot capital")
+			axs[0].plot(*downsample_series(t, s.past, n_points, downsample), label=s.name)
+		ticks = self.capital_history.ticks
+		# markers only while they can be told apart
+		style = 'o-' if (len(ticks) if downsample is None else min(len(ticks), n_points)) <= 200 else '-'
+		axs[1].plot(*downsample_series(ticks, self.capital_history.capital, n_points, downsample), style, label="capital")
+		axs[1].plot(*downsample_series(ticks, self.capital_history.tot_capital, n_points, downsample), style, label="tot capital")
 		axs[1].axhline(0, color='r', linewidth=0.5)
 
 		axs[0].grid()
@@ -134,21 +396,109 @@ class AlgorithmStrategy:
 		axs[1].set_xlim(axs[0].get_xlim())
 		fig.legend(loc="center right")
 		# fig.set_size_inches(13.5, 8.5)
-		# fig.set_size_inches(13.5, 8.5)
 		return fig
 
 
+class BatchedAlgorithm:
+	"""
+	runs alg_class once for every row of a params matrix in a single walk over the prices:
+	portfolio, capital and the strategy state of every run are arrays with one row per params row.
+	the decisions are taken on prices and the trades settled on settle, an aligned series (prices when None)
+	"""
+
+	def __init__(
+			self,
+			alg_class: typing.ClassVar,
+			prices: np.ndarray,
+			start: int,
+			params: np.ndarray,
+			start_capital: float = 0,
+			settle: np.ndarray = None
+			):
+		self.alg_class = alg_class
+		self.prices: np.ndarray = prices
+		self.settle: np.ndarray = settle if settle is not None else prices
+		self.ends = np.arange(start, prices.shape[1] - 1)
+		self.tick_i = 0
+
+		alg_class.batched_params(self, params)
+
+		n_runs, n_stocks = len(params), len(prices)
+		self.portfolio = np.zeros((n_runs, n_stocks), dtype=np.int64)
+		self.capital = np.full(n_runs, start_capital, dtype=np.float64)
+		self.max_capital = self.capital.copy()
+		self.min_capital = self.capital.copy()
+		self.n_tran = np.zeros(n_runs, dtype=np.int64)
+
+		alg_class.batched_setup(self)
+
+	def price(self, stock_i: int) -> float:
+		return self.prices[stock_i, self.ends[self.tick_i]]
+
+	def settle_price(self, stock_i: int) -> float:
+		return self.settle[stock_i, self.ends[self.tick_i]]
+
+	def average(self, stock_i: int) -> np.ndarray:
+		return self.averages[self.time_comp_i, stock_i, self.tick_i]
+
+	def tick(self) -> None:
+		capital_changed = False
+		for stock_i in range(len(self.prices)):
+			to_buy, to_sell = self.alg_class.batched_buy_sell(self, stock_i)
+			traded = np.flatnonzero(to_buy + to_sell)
+			if len(traded) == 0:
+				continue
+			capital_changed = True
+			price = self.settle_price(stock_i)
+			to_buy, to_sell = to_buy[traded], to_sell[traded]
+			self.n_tran[traded] += to_buy + to_sell
+			self.portfolio[traded, stock_i] += to_buy - to_sell
+
+			# same order of operations as AlgorithmStrategy.trade
+			capital = self.capital[traded]
+			capital = capital - np.where(to_buy > 0, (price * to_buy) + transaction_cost(price), 0.0)
+			capital = capital + np.where(to_sell > 0, (price * to_sell) - transaction_cost(price), 0.0)
+			self.capital[traded] = round_2(capital)
+		if capital_changed:
+			np.maximum(self.max_capital, self.capital, out=self.max_capital)
+			np.minimum(self.min_capital, self.capital, out=self.min_capital)
+		self.tick_i += 1
+
+	def run(self) -> dict[str, np.ndarray]:
+		while self.tick_i < len(self.ends):
+			self.tick()
+		return self.stats()
+
+	def tot_stock_value(self) -> np.ndarray:
+		# one np.dot per run like AlgorithmStrategy.tot_stock_value, a matrix product could sum in another order
+		prices = np.ascontiguousarray(self.settle[:, -1])
+		return round_2(np.array([np.dot(prices, holdings) for holdings in self.portfolio], dtype=np.float64))
+
+	def stats(self) -> dict[str, np.ndarray]:
+		tot_stock_value = self.tot_stock_value()
+		return {
+			'n transactions': self.n_tran,
+			'max capital': self.max_capital,
+			'min capital': self.min_capital,
+			'final portfolio': self.portfolio,
+			'liquid': self.capital,
+			'tot stock value': tot_stock_value,
+			'tot capital': round_2(self.capital + tot_stock_value)
+			}
+
+
 class AllInAllOut(AlgorithmStrategy):
 	def __init__(self, market: Market, start_capital: float = 10000, params: list = None):
 		super().__init__(market, "AllInAllOut", start_capital)
 
+		self.n_stock_mov, self.buy_perc, self.sell_perc, self.time_comp = self.read_params(params)
+
+	@staticmethod
+	def read_params(params: list) -> tuple[int, float, float, int]:
 		if len(params) != 4 or params is None:
 			params = (4, -0.1, 0.2, -10)
 
-		self.n_stock_mov = int(params[0])
-		self.buy_perc = params[1]
-		self.sell_perc = params[2]
-		self.time_comp = int(params[3])
+		return int(params[0]), params[1], params[2], int(params[3])
 
 	def buy_sell(self, stock: Stock) -> tuple[int, int]:
 		if self.portfolio[stock.name] == 0 and stock.price() + (transaction_cost(stock.price()) / self.n_stock_mov) < stock.historical_average(
@@ -163,20 +513,56 @@ class AllInAllOut(AlgorithmStrategy):
 			return 0, self.portfolio[stock.name]
 		return 0, 0
 
+	@classmethod
+	def vectorized_moves(cls, prices: np.ndarray, start: int, params: list) -> list[np.ndarray]:
+		n_stock_mov, buy_perc, sell_perc, time_comp = cls.read_params(params)
+		ends = np.arange(start, prices.shape[1] - 1)
+		moves = []
+		for past in prices:
+			price = past[ends]
+			avg = rolling_average(past, ends, from_time=time_comp)
+			cost = transaction_cost(price) / n_stock_mov
+			next_buy = next_true(price + cost < avg * (1 + buy_perc))
+			next_sell = next_true(price - cost > avg * (1 + sell_perc))
+
+			# the signals are independent of the portfolio, only the alternation buy -> sell -> buy is sequential
+			rows = []
+			i = next_buy[0]
+			while i < len(ends):
+				rows.append((ends[i] + 1, n_stock_mov, 0))
+				i = next_sell[i + 1]
+				if i >= len(ends):
+					break
+				rows.append((ends[i] + 1, 0, n_stock_mov))
+				i = next_buy[i + 1]
+			moves.append(np.array(rows, dtype=np.int64).reshape(-1, 3))
+		return moves
+
+	@classmethod
+	def batched_buy_sell(cls, batch: BatchedAlgorithm, stock_i: int) -> tuple[np.ndarray, np.ndarray]:
+		price = batch.price(stock_i)
+		avg = batch.average(stock_i)
+		holding = batch.portfolio[:, stock_i]
+		cost = transaction_cost(price) / batch.n_stock_mov
+		to_buy = np.where((holding == 0) & (price + cost < avg * (1 + batch.buy_perc)), batch.n_stock_mov, 0)
+		to_sell = np.where((holding > 0) & (price - cost > avg * (1 + batch.sell_perc)), holding, 0)
+		return to_buy, to_sell
+
 
 class OneInAllOut(AlgorithmStrategy):
 	def __init__(self, market: Market, start_capital: float = 10000, params: list = None):
 		super().__init__(market, "OneInAllOut", start_capital)
 
+		self.n_stock_mov, self.buy_perc, self.sell_perc, self.time_comp = self.read_params(params)
+		self.buyed_price: dict = {stock.name: [] for stock in self.market.stocks}
+
+	@staticmethod
+	def read_params(params: list) -> tuple[int, float, float, int]:
 		if len(params) != 4 or params is None:
 			raise Exception
 		# params = [1.0, 0.0, 0.5, -2.0]
 
-		self.n_stock_mov = int(params[0])
-		self.buy_perc = params[1]
-		self.sell_perc = params[2]
-		self.time_comp = int(params[3])
-		self.buyed_price: dict = {stock.name: [] for stock in self.market.stocks}
+		return int(params[0]), params[1], params[2], int(params[3])
 
 	def avg_stock_price(self, name: str) -> float:
 		return (sum(self.buyed_price[name]) / len(self.buyed_price[name])) if len(self.buyed_price[name]) > 0 else 0
@@ -195,3 +581,64 @@ class OneInAllOut(AlgorithmStrategy):
 			self.buyed_price[stock.name].clear()
 			return 0, self.portfolio[stock.name]
 		return 0, 0
+
+	@classmethod
+	def vectorized_moves(cls, prices: np.ndarray, start: int, params: list) -> list[np.ndarray]:
+		n_stock_mov, buy_perc, sell_perc, time_comp = cls.read_params(params)
+		ends = np.arange(start, prices.shape[1] - 1)
+		moves = []
+		for past in prices:
+			price = past[ends]
+			avg = rolling_average(past, ends, from_time=time_comp)
+			buy = price + (transaction_cost(price) / n_stock_mov) <= avg * (1 + buy_perc)
+			sell_cost = np.broadcast_to(transaction_cost(price), price.shape)
+
+			# buys never depend on the portfolio, sells depend on the buys since the last sell:
+			# look for the next sell in chunks that double in size, so the whole scan stays O(len(ends))
+			sells = []
+			i, n_buyed, tot_buyed, chunk = 0, 0, 0.0, 64
+			while i < len(ends):
+				j = min(i + chunk, len(ends))
+				c_buy = buy[i:j]
+				# counts and sums of the buys before each tick, summed in the same order as avg_stock_price
+				c_n = n_buyed + np.concatenate(([0], np.cumsum(c_buy)))
+				c_tot = np.cumsum(np.concatenate(([tot_buyed], np.where(c_buy, price[i:j], 0.0))))
+				with np.errstate(divide='ignore', invalid='ignore'):
+					holding = c_n[:-1] * n_stock_mov
+					c_sell = ~c_buy & (c_n[:-1] > 0) & (
+							price[i:j] - (sell_cost[i:j] / holding) >= (c_tot[:-1] / c_n[:-1]) * (1 + sell_perc)
+					)
+				found = np.flatnonzero(c_sell)
+				if len(found) == 0:
+					n_buyed, tot_buyed = int(c_n[-1]), float(c_tot[-1])
+					i = j
+					chunk *= 2
+					continue
+				k = found[0]
+				sells.append((ends[i + k] + 1, 0, int(holding[k])))
+				i, n_buyed, tot_buyed, chunk = i + k + 1, 0, 0.0, 64
+
+			buys = np.stack((ends[buy] + 1, np.full(np.count_nonzero(buy), n_stock_mov), np.zeros(np.count_nonzero(buy))), axis=1)
+			rows = np.concatenate((buys.astype(np.int64), np.array(sells, dtype=np.int64).reshape(-1, 3)))
+			moves.append(rows[np.argsort(rows[:, 0], kind='stable')])
+		return moves
+
+	@classmethod
+	def batched_setup(cls, batch: BatchedAlgorithm) -> None:
+		batch.n_buyed = np.zeros(batch.portfolio.shape, dtype=np.int64)
+		batch.tot_buyed = np.zeros(batch.portfolio.shape, dtype=np.float64)
+
+	@classmethod
+	def batched_buy_sell(cls, batch: BatchedAlgorithm, stock_i: int) -> tuple[np.ndarray, np.ndarray]:
+		price = batch.price(stock_i)
+		holding = batch.portfolio[:, stock_i]
+		n_buyed = batch.n_buyed[:, stock_i]
+		tot_buyed = batch.tot_buyed[:, stock_i]
+
+		buy = price + (transaction_cost(price) / batch.n_stock_mov) <= batch.average(stock_i) * (1 + batch.buy_perc)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			sell = ~buy & (holding > 0) & (price - (transaction_cost(price) / holding) >= (tot_buyed / n_buyed) * (1 + batch.sell_perc))
+
+		batch.n_buyed[:, stock_i] = np.where(sell, 0, n_buyed + buy)
+		batch.tot_buyed[:, stock_i] = np.where(sell, 0.0, tot_buyed + np.where(buy, price, 0.0))
+		return np.where(buy, batch.n_stock_mov, 0), np.where(sell, holding, 0)
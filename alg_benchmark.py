@@ -1,19 +1,30 @@
+import collections
+import itertools
 import os
 import typing
 
+import numpy as np
 from matplotlib import pyplot as plt
 
 import alg
+import scenario_file
+from alg_result_cache import ResultCache
 from market import Market, Stock
 
 
 class BenchmarkStock(Stock):
-	def __init__(self, name: str, end_index: int, past: list = None):
+	def __init__(self, name: str, end_index: int, past: list = None, settle: np.ndarray = None):
 		super().__init__(name, past)
 		self.end_index = end_index if end_index > 0 else len(self.past) + end_index
+		# aligned series the trades are settled at, past when None
+		self.settle = settle
 
 	def price(self) -> float:
-		return self.past[self.end_index]
+		# float() so that round() on the capital stays the builtin one when past is a numpy array
+		return float(self.past[self.end_index])
+
+	def settle_price(self) -> float:
+		return float(self.settle[self.end_index]) if self.settle is not None else self.price()
 
 	def historical_average(self, from_time: int = 0, to_time: int = -1) -> float:
 		if from_time > self.end_index or to_time > self.end_index:
@@ -55,64 +66,240 @@ class BenchmarkStock(Stock):
 
 
 class ReproduceMoves(alg.AlgorithmStrategy):
-	def __init__(self, market: Market, start_capital: float, moves: dict[int: tuple[int, int]]):
+	def __init__(self, market: Market, start_capital: float, moves: alg.TradeLedger):
 		super().__init__(market, "Reproducing", start_capital)
-		self.moves: dict[int: tuple[int, int]] = moves
+
+		# the ledger is in tick order: walk it with a cursor, matching the stocks by name
+		records = moves.records
+		self.to_reproduce: list[tuple[int, str, int, int]] = list(zip(
+			records['tick'].tolist(),
+			[moves.names[i] for i in records['stock'].tolist()],
+			records['bought'].tolist(),
+			records['sold'].tolist()
+			))
+		self.cursor = 0
 
 	def buy_sell(self, stock: Stock) -> tuple[int, int]:
-		if self.tick_count in self.moves[stock.name]:
-			return self.moves[stock.name][self.tick_count]
+		while self.cursor < len(self.to_reproduce) and self.to_reproduce[self.cursor][0] < self.tick_count:
+			self.cursor += 1
+		i = self.cursor
+		while i < len(self.to_reproduce) and self.to_reproduce[i][0] == self.tick_count:
+			if self.to_reproduce[i][1] == stock.name:
+				return self.to_reproduce[i][2], self.to_reproduce[i][3]
+			i += 1
 		return 0, 0
 
 
+class ScenarioCache:
+	"""
+	lru cache of the loaded scenarios, keyed on scenario, selected stocks and modification time of the files,
+	holding at most max_bytes of prices
+	"""
+
+	def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+		self.max_bytes = max_bytes
+		self.n_bytes = 0
+		self.entries: collections.OrderedDict[tuple, tuple[list[str], np.ndarray, np.ndarray | None]] = collections.OrderedDict()
+
+	def get(self, key: tuple) -> tuple[list[str], np.ndarray, np.ndarray | None] | None:
+		if key not in self.entries:
+			return None
+		self.entries.move_to_end(key)
+		return self.entries[key]
+
+	def put(self, key: tuple, entry: tuple[list[str], np.ndarray, np.ndarray | None]) -> None:
+		size = entry[1].nbytes
+		if size > self.max_bytes:
+			return
+		if key in self.entries:
+			self.n_bytes -= self.entries.pop(key)[1].nbytes
+		self.entries[key] = entry
+		self.n_bytes += size
+		while self.n_bytes > self.max_bytes:
+			_, (_, prices, _) = self.entries.popitem(last=False)
+			self.n_bytes -= prices.nbytes
+
+	def clear(self) -> None:
+		self.entries.clear()
+		self.n_bytes = 0
+
+
 class MarketBenchmark(Market):
+	# scenario -> (stock names, prices) already in memory, e.g. attached from shared memory by the sweep workers
+	shared_scenarios: dict[str, tuple[list[str], np.ndarray]] = {}
+	# version of every shared scenario, a new one every time it is registered: part of its cache key,
+	# so the benchmarks that loaded the old prices of a name load the new ones
+	shared_versions: dict[str, int] = {}
+	shared_counter: typing.Iterator[int] = itertools.count(1)
+	# shared by all the instances of the process
+	scenario_cache: ScenarioCache = ScenarioCache()
+	# persistent cache of the stats, off when None
+	result_cache: ResultCache | None = None
+
 	def __init__(self):
 		super(MarketBenchmark, self).__init__()
 
 		self.n_benchmarks = 0
 		self.loaded_scenario: str = ""
+		self.loaded_key: tuple | None = None
+		self.settle_key: tuple | None = None
+		self.prices: np.ndarray | None = None
+		# prices the trades are settled at, when a settle scenario is loaded
+		self.settle: np.ndarray | None = None
+		self.timestamps: np.ndarray | None = None
+
+	@staticmethod
+	def share(scenario: str, names: list[str], prices: np.ndarray) -> None:
+		"""registers prices as the shared scenario, replacing the prices of the same name"""
+		MarketBenchmark.shared_scenarios[scenario] = (names, prices)
+		MarketBenchmark.shared_versions[scenario] = next(MarketBenchmark.shared_counter)
+
+	@staticmethod
+	def share_paths(paths: np.ndarray, prefix: str = "sim", names: list[str] = None) -> list[str]:
+		"""
+		every path of an (n_paths, n_stocks, time_len) array, like market.sim_paths, as the shared scenario <prefix>/<i>.
+		the scenarios are views of paths, nothing is written or copied
+		"""
+		if names is None:
+			names = [f"sim-{i}" for i in range(paths.shape[1])]
+		scenarios = [f"{prefix}/{i}" for i in range(len(paths))]
+		for scenario, path in zip(scenarios, paths):
+			MarketBenchmark.share(scenario, names, path)
+		return scenarios
+
+	@staticmethod
+	def scenario_source(scenario: str) -> tuple[str, float]:
+		"""
+		where the scenario is read from ("shared", "binary" or "text") and the last modification time of its files,
+		the version of a shared one
+		"""
+		if scenario in MarketBenchmark.shared_scenarios:
+			return "shared", MarketBenchmark.shared_versions.get(scenario, 0)
 
-	def load_scenario(self, scenario: str = "current", stocks_scenario: list[str] = None, start: int = -1):
+		stock_dir = f"./scenarios/{scenario}"
+		text_mtime = max((entry.stat().st_mtime for entry in os.scandir(stock_dir)), default=0) if os.path.isdir(stock_dir) else None
+		binary_path = scenario_file.scenario_path(scenario)
+		if os.path.exists(binary_path) and (text_mtime is None or os.path.getmtime(binary_path) >= text_mtime):
+			return "binary", os.path.getmtime(binary_path)
+		if text_mtime is None:
+			raise FileNotFoundError(f"scenario {scenario} not found")
+		return "text", text_mtime
+
+	@staticmethod
+	def read_scenario(scenario: str, stocks_scenario: list[str], source: str) -> tuple[list[str], np.ndarray, np.ndarray | None]:
+		"""names, prices and timestamps of the stocks of the scenario in stocks_scenario (all of them when empty)"""
+		timestamps = None
+		if source == "shared":
+			names, prices = MarketBenchmark.shared_scenarios[scenario]
+		elif source == "binary":
+			names, prices, timestamps = scenario_file.read_scenario(scenario_file.scenario_path(scenario))
+		else:
+			stock_dir = f"./scenarios/{scenario}"
+			names, pasts = [], []
+			for file in os.listdir(stock_dir):
+				if len(stocks_scenario) == 0 or file in stocks_scenario:
+					with open(f"{stock_dir}/{file}", "r") as f:
+						pasts.append([float(line.rstrip()) for line in f.readlines() if len(line.rstrip()) > 0])
+					names.append(file)
+			prices = np.array(pasts, dtype=np.float64)
+			prices.setflags(write=False)
+
+		selected = [i for i, name in enumerate(names) if len(stocks_scenario) == 0 or name in stocks_scenario]
+		if len(selected) < len(names):
+			names, prices = [names[i] for i in selected], prices[selected]
+		return names, prices, timestamps
+
+	def scenario_entry(self, scenario: str, stocks_scenario: list[str]) -> tuple[tuple, tuple]:
+		"""cache key and (names, prices, timestamps) of the scenario, read once per process"""
+		source, mtime = self.scenario_source(scenario)
+		key = (scenario, tuple(sorted(stocks_scenario)), source, mtime)
+		if self.loaded_key == key:
+			return key, ([stock.name for stock in self.stocks], self.prices, self.timestamps)
+
+		entry = MarketBenchmark.scenario_cache.get(key)
+		if entry is None:
+			entry = self.read_scenario(scenario, stocks_scenario, source)
+			if source != "shared":
+				MarketBenchmark.scenario_cache.put(key, entry)
+		return key, entry
+
+	def load_scenario(self, scenario: str = "current", stocks_scenario: list[str] = None, start: int = -1, settle_scenario: str = None):
+		"""
+		the stocks of the scenario from start. with settle_scenario the strategies decide on the prices of scenario
+		and trade (and value their holdings) at the prices of settle_scenario, that has to be aligned with it
+		"""
 		if scenario is None or scenario == "":
 			scenario = "current"
-		if self.loaded_scenario == scenario:
-			return
-
-		self.loaded_scenario = scenario
-
 		if stocks_scenario is None:
 			stocks_scenario = []
 
-		stock_dir = f"./scenarios/{scenario}"
-		self.stocks.clear()
-		if len(stocks_scenario) == 0:
-			stocks_scenario = os.listdir(stock_dir)
-		for file in os.listdir(stock_dir):
-			if file in stocks_scenario:
-				with open(f"{stock_dir}/{file}", "r") as f:
-					past = [float(line.rstrip()) for line in f.readlines() if len(line.rstrip()) > 0]
-				self.stocks.append(BenchmarkStock(file, past=past, end_index=start))
+		key, entry = self.scenario_entry(scenario, stocks_scenario)
+		settle_key, settle_entry = self.scenario_entry(settle_scenario, stocks_scenario) if settle_scenario is not None else (None, None)
+		if self.loaded_key == key and self.settle_key == settle_key:
+			self.start_from(start)
+			return
+
+		# the stocks are views of the prices, nothing is copied
+		names, self.prices, self.timestamps = entry
+		self.settle = None
+		if settle_entry is not None:
+			settle_names, settle = settle_entry[0], settle_entry[1]
+			if sorted(settle_names) != sorted(names) or settle.shape != self.prices.shape:
+				raise ValueError(f"scenario {settle_scenario} is not aligned with {scenario}")
+			# the stocks are matched by name, the two scenarios can list them in different orders
+			if settle_names != names:
+				settle = settle[[settle_names.index(name) for name in names]]
+			self.settle = settle
+		self.stocks = [
+			BenchmarkStock(name, past=self.prices[i], end_index=start, settle=self.settle[i] if self.settle is not None else None)
+			for i, name in enumerate(names)
+			]
+		self.loaded_scenario = scenario
+		self.loaded_key = key
+		self.settle_key = settle_key
+
+	def result_keys(self, kind: str, alg_class: typing.ClassVar, params: list, start: int, end: int = None) -> list[str] | None:
+		"""result_cache keys of the rows of params on the loaded scenario, None when there is no result cache"""
+		if MarketBenchmark.result_cache is None:
+			return None
+		# the prices of a shared scenario can be replaced under the same name, they are hashed at every call, once for all the params
+		shared = self.loaded_key[2] == "shared" or (self.settle_key is not None and self.settle_key[2] == "shared")
+		memo = (self.loaded_key, self.settle_key, end) if not shared else None
+		names = [stock.name for stock in self.stocks]
+		prices = self.prices[:, :end] if self.settle is None else np.concatenate((self.prices[:, :end], self.settle[:, :end]))
+		prices_hash = MarketBenchmark.result_cache.prices_hash(names, prices, memo=memo)
+		return [MarketBenchmark.result_cache.key(kind, alg_class, p, prices_hash, start) for p in params]
 
 	def start_from(self, start: int):
 		if self.loaded_scenario == "" or self.loaded_scenario is None:
 			raise Exception("scenario not loaded")
 
 		for stock in self.stocks:
-			stock.end_index = start
+			stock.end_index = start if start >= 0 else len(stock.past) + start
 
 	def next(self):
 		for stock in self.stocks:
 			stock.next()
 
+	def current_prices(self) -> np.ndarray:
+		return np.ascontiguousarray(self.prices[:, self.stocks[0].end_index])
+
+	def settle_prices(self) -> np.ndarray:
+		if self.settle is None:
+			return self.current_prices()
+		return np.ascontiguousarray(self.settle[:, self.stocks[0].end_index])
+
 	def history_len(self) -> int:
 		return self.stocks[0].end_index + 1
 
 	def time_left(self) -> int:
 		return len(self.stocks[0].past) - self.history_len()
 
-	def cycle(self, tick_fun: typing.Callable):
+	def cycle(self, *tick_funs: typing.Callable):
+		"""walks the scenario once, calling every tick_fun on each tick"""
 		while self.time_left() > 0:
-			tick_fun()
+			for tick_fun in tick_funs:
+				tick_fun()
 			self.next()
 
 	def start_benchmark(
@@ -122,13 +309,14 @@ class MarketBenchmark(Market):
 			stocks_scenario: list[str] = None,
 			params: list = None,
 			start: int = 20,
-			print_stats: bool = True
+			print_stats: bool = True,
+			settle_scenario: str = None
 			) -> tuple[plt.Figure, dict[str, typing.Any]]:
 
 		if params is None:
 			params = []
 
-		self.load_scenario(scenario=scenario, stocks_scenario=stocks_scenario, start=start)
+		self.load_scenario(scenario=scenario, stocks_scenario=stocks_scenario, start=start, settle_scenario=settle_scenario)
 		a = alg_class(self, start_capital=0, params=params)
 		a.tick_count = start
 		a.clear_log()
@@ -143,6 +331,26 @@ class MarketBenchmark(Market):
 		self.n_benchmarks += 1
 		return a.gen_fig(fig_index=self.n_benchmarks), a.stats()
 
+	def run_strategy(
+			self,
+			alg_class: typing.ClassVar,
+			scenario: str = None,
+			stocks_scenario: list[str] = None,
+			start: int = 20,
+			settle_scenario: str = None,
+			**kwargs
+			) -> alg.AlgorithmStrategy:
+		"""alg_class(self, start_capital=0, **kwargs) run on the scenario with its log disabled, for its history and figure"""
+		self.load_scenario(scenario=scenario, stocks_scenario=stocks_scenario, start=start, settle_scenario=settle_scenario)
+		a: alg.AlgorithmStrategy = alg_class(self, start_capital=0, **kwargs)
+		a.tick_count = start
+		a.disable_log()
+
+		self.cycle(a.tick)
+
+		a.update_history()
+		return a
+
 	def stats_of_benchmark(
 			self,
 			alg_class: typing.ClassVar,
@@ -150,13 +358,20 @@ class MarketBenchmark(Market):
 			stocks_scenario: list[str] = None,
 			params: list = None,
 			start: int = 20,
-			print_stats: bool = False
+			print_stats: bool = False,
+			settle_scenario: str = None
 			) -> dict[str, typing.Any]:
 
 		if params is None:
 			params = []
 
-		self.load_scenario(scenario=scenario, stocks_scenario=stocks_scenario, start=start)
+		self.load_scenario(scenario=scenario, stocks_scenario=stocks_scenario, start=start, settle_scenario=settle_scenario)
+		keys = self.result_keys("stats", alg_class, [params], start) if not print_stats else None
+		if keys is not None:
+			stats = MarketBenchmark.result_cache.get(keys[0])
+			if stats is not None:
+				return stats
+
 		a: alg.AlgorithmStrategy = alg_class(self, start_capital=0, params=params)
 		a.tick_count = start
 		a.disable_log()
@@ -166,11 +381,132 @@ class MarketBenchmark(Market):
 		a.update_history()
 		if print_stats:
 			a.print_stats()
+		if keys is not None:
+			MarketBenchmark.result_cache.put(keys[0], a.stats())
+		return a.stats()
+
+	def stats_of_strategies(
+			self,
+			strategies: list[tuple],
+			scenario: str = None,
+			stocks_scenario: list[str] = None,
+			start: int = 20,
+			print_stats: bool = False
+			) -> list[dict[str, typing.Any]]:
+		"""
+		stats_of_benchmark of every (alg_class, params) or (alg_class, params, start_capital) in strategies,
+		all ticking in a single walk over the scenario: prices and rolling stats of the stocks are shared.
+		returns one stats row per strategy, with its params
+		"""
+
+		self.load_scenario(scenario=scenario, stocks_scenario=stocks_scenario, start=start)
+		algs: list[alg.AlgorithmStrategy] = []
+		for strategy in strategies:
+			alg_class, params = strategy[0], strategy[1] if strategy[1] is not None else []
+			a: alg.AlgorithmStrategy = alg_class(self, start_capital=strategy[2] if len(strategy) > 2 else 0, params=params)
+			a.tick_count = start
+			a.disable_log()
+			algs.append(a)
+
+		self.cycle(*[a.tick for a in algs])
+
+		rows = []
+		for a, strategy in zip(algs, strategies):
+			a.update_history()
+			rows.append({**a.stats(), 'params': strategy[1]})
+		if print_stats:
+			self.print_stats_table(rows)
+		return rows
+
+	@staticmethod
+	def print_stats_table(rows: list[dict[str, typing.Any]]) -> None:
+		columns = ['name', 'params', 'n transactions', 'max capital', 'min capital', 'liquid', 'tot stock value', 'tot capital']
+		cells = [[str(row[c]) for c in columns] for row in rows]
+		widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+		print(" | ".join(c.ljust(w) for c, w in zip(columns, widths)))
+		print("-+-".join("-" * w for w in widths))
+		for r in cells:
+			print(" | ".join(c.ljust(w) for c, w in zip(r, widths)))
+
+	def vectorized_stats_of_benchmark(
+			self,
+			alg_class: typing.ClassVar,
+			scenario: str = None,
+			stocks_scenario: list[str] = None,
+			params: list = None,
+			start: int = 20,
+			print_stats: bool = False,
+			settle_scenario: str = None
+			) -> dict[str, typing.Any]:
+		"""
+		same result as stats_of_benchmark, but the moves are computed with alg_class.vectorized_moves on the whole
+		history and the trades are replayed with array operations (AlgorithmStrategy.replay), with the same rounding of
+		the capital as the tick loop
+		"""
+
+		if params is None:
+			params = []
+
+		self.load_scenario(scenario=scenario, stocks_scenario=stocks_scenario, start=start, settle_scenario=settle_scenario)
+		# the same stats as stats_of_benchmark, so the same cached results
+		keys = self.result_keys("stats", alg_class, [params], start) if not print_stats else None
+		if keys is not None:
+			stats = MarketBenchmark.result_cache.get(keys[0])
+			if stats is not None:
+				return stats
+
+		moves = alg_class.vectorized_moves(self.prices, start, params)
+
+		a: alg.AlgorithmStrategy = alg_class(self, start_capital=0, params=params)
+		a.disable_log()
+
+		trades = np.concatenate([np.column_stack((np.full(len(m), i), m)) for i, m in enumerate(moves)])
+		a.replay(trades[np.lexsort((trades[:, 0], trades[:, 1]))], self.settle if self.settle is not None else self.prices)
+
+		self.start_from(max(start, self.prices.shape[1] - 1))
+		a.tick_count = max(start, self.prices.shape[1] - 1)
+		a.update_history()
+		if print_stats:
+			a.print_stats()
+		if keys is not None:
+			MarketBenchmark.result_cache.put(keys[0], a.stats())
 		return a.stats()
 
+	def batched_stats_of_benchmark(
+			self,
+			alg_class: typing.ClassVar,
+			scenario: str = None,
+			stocks_scenario: list[str] = None,
+			params: np.ndarray = None,
+			start: int = 20,
+			end: int = None,
+			settle_scenario: str = None
+			) -> dict[str, np.ndarray]:
+		"""
+		stats_of_benchmark of every row of params in one walk over the scenario, every stat is an array with one value per row.
+		end truncates the scenario to its first end ticks
+		"""
+
+		self.load_scenario(scenario=scenario, stocks_scenario=stocks_scenario, start=start, settle_scenario=settle_scenario)
+		params = np.atleast_2d(params)
+		settle = self.settle[:, :end] if self.settle is not None else None
+		keys = self.result_keys("batched", alg_class, params, start, end=end)
+		if keys is None or len(keys) == 0:
+			return alg.BatchedAlgorithm(alg_class, self.prices[:, :end], start, params, settle=settle).run()
+
+		# only the rows missing from the cache are run, the stats of a row are its element of every array
+		rows = MarketBenchmark.result_cache.get_many(keys)
+		missing = [i for i, key in enumerate(keys) if key not in rows]
+		if len(missing) > 0:
+			stats = alg.BatchedAlgorithm(alg_class, self.prices[:, :end], start, params[missing], settle=settle).run()
+			computed = {keys[i]: {k: v[j] for k, v in stats.items()} for j, i in enumerate(missing)}
+			MarketBenchmark.result_cache.put_many(computed)
+			rows.update(computed)
+		return {k: np.array([rows[key][k] for key in keys]) for k in rows[keys[0]]}
+
 	def reproduce_moves(
 			self,
-			moves: dict[str: dict[int: tuple[int, int]]],
+			moves: alg.TradeLedger,
 			scenario: str,
 			stocks_scenario: list[str],
 			start: int,
@@ -184,6 +520,7 @@ class MarketBenchmark(Market):
 		reproduce.clear_log()
 		# repr.disable_log()
 		self.cycle(reproduce.tick)
+		reproduce.close_log()
 
 		if print_stats:
 			reproduce.print_stats()
@@ -206,38 +543,30 @@ class MarketBenchmark(Market):
 			print_stats: bool = False,
 			show: bool = False
 			) -> tuple[plt.Figure, dict[str, typing.Any]]:
+		"""
+		alg_class deciding on the normalized prices of the day and trading at its real prices, in a single pass.
+		the figure is None unless show
+		"""
 
-		if params is None:
-			params = []
-
-		scenario = f"daily/{day.removeprefix('daily/')}_norm"
-		s: dict
+		day = day.removeprefix('daily/')
 		if show:
-			_, s = self.start_benchmark(
+			return self.start_benchmark(
 				alg_class=alg_class,
-				scenario=scenario,
-				stocks_scenario=stocks_scenario,
-				params=params,
-				start=start,
-				print_stats=print_stats
-				)
-		else:
-			s = self.stats_of_benchmark(
-				alg_class=alg.OneInAllOut,
-				scenario=scenario,
+				scenario=f"daily/{day}_norm",
 				stocks_scenario=stocks_scenario,
 				params=params,
 				start=start,
-				print_stats=print_stats
+				print_stats=print_stats,
+				settle_scenario=f"daily/{day}"
 				)
-
-		return self.reproduce_moves(
-			moves=s['moves'],
-			scenario=f"daily/{day.removeprefix('daily/')}",
+		return None, self.stats_of_benchmark(
+			alg_class=alg_class,
+			scenario=f"daily/{day}_norm",
 			stocks_scenario=stocks_scenario,
+			params=params,
 			start=start,
 			print_stats=print_stats,
-			show=show
+			settle_scenario=f"daily/{day}"
 			)
 
 
@@ -1,67 +1,253 @@
+import functools
+import json
 import multiprocessing as mp
+import os
+import time
 import typing
+from multiprocessing import shared_memory
 
 import numpy as np
 
+import alg
+import alg_profile
 from alg_benchmark import MarketBenchmark
 
 
-all_params: list
+class ParamsGrid:
+	"""
+	the np.linspace grid of bounds and iterations, in the order of nested loops over the params (the last one changes
+	fastest). combinations are computed from their rank when needed, so the grid is never materialized.
+	start and stop restrict it to a shard of ranks
+	"""
 
+	def __init__(self, bounds: list[tuple[float, float]], iterations: list[int], start: int = 0, stop: int = None):
+		self.bounds = bounds
+		self.iterations = iterations
+		self.axes: list[np.ndarray] = [np.linspace(b[0], b[1], n) for b, n in zip(bounds, iterations)]
+		self.size = int(np.prod(iterations, dtype=np.int64))
+		self.start = start
+		self.stop = self.size if stop is None else min(stop, self.size)
 
-def recursive_params(bounds: list[tuple[float, float]], iterations: list[int], params: list, index: int = 0) -> list:
-	"""deprecated"""
-	if len(params) == len(bounds):
-		return params
-	else:
-		for x in np.linspace(bounds[index][0], bounds[index][1], iterations[index]):
-			p = recursive_params(bounds=bounds, iterations=iterations, index=index + 1, params=params + [float(x)])
-			if p is not None:
-				all_params.append(p)
+	def __len__(self) -> int:
+		return max(0, self.stop - self.start)
+
+	def ranks(self, ranks: np.ndarray) -> np.ndarray:
+		"""combinations of the absolute ranks, one row each"""
+		indexes = np.unravel_index(ranks, self.iterations)
+		return np.column_stack([axis[i] for axis, i in zip(self.axes, indexes)])
+
+	def __getitem__(self, item: int | slice) -> list[float] | np.ndarray:
+		if isinstance(item, slice):
+			return self.ranks(self.start + np.arange(*item.indices(len(self))))
+		if item < 0:
+			item += len(self)
+		if not 0 <= item < len(self):
+			raise IndexError("grid rank out of range")
+		return self.ranks(np.array([self.start + item]))[0].tolist()
+
+	def __iter__(self) -> typing.Iterator[list[float]]:
+		for chunk in self.chunks():
+			yield from chunk.tolist()
+
+	def chunks(self, chunk_size: int = 1024) -> typing.Iterator[np.ndarray]:
+		for i in range(self.start, self.stop, chunk_size):
+			yield self.ranks(np.arange(i, min(i + chunk_size, self.stop)))
+
+	def shard(self, start: int, stop: int) -> "ParamsGrid":
+		"""the ranks start:stop of this grid"""
+		return ParamsGrid(self.bounds, self.iterations, start=self.start + start, stop=min(self.start + stop, self.stop))
+
+
+def implements(alg_class: typing.ClassVar, method: str) -> bool:
+	return getattr(alg_class, method).__func__ is not getattr(alg.AlgorithmStrategy, method).__func__
+
+
+def stats_result(stats: dict[str, typing.Any], result_type: int = 0) -> typing.Any:
+	"""the value to maximize, works on the stats of a single run and on the batched ones"""
+	if result_type == 1:
+		return stats['tot capital'] / (np.abs(stats['liquid']) + 1)
+	return stats['tot capital']
+
+
+worker_benchmark: MarketBenchmark
+worker_shared: list[shared_memory.SharedMemory] = []
 
 
-def threading_combinations(
-		threads_results: list,
-		i: int,
-		params_list: list,
+def attach_scenarios(shared_info: dict[str, tuple[str, tuple[int, int], list[str]]], profile_options: dict = None) -> None:
+	"""
+	pool initializer: attaches the shared prices of the scenarios, so the workers never read the scenario files.
+	with profile_options the worker profiles with a profiler of its own
+	"""
+	global worker_benchmark
+
+	if profile_options is not None:
+		alg_profile.enable(**profile_options)
+
+	for scenario, (shm_name, shape, names) in shared_info.items():
+		shm = shared_memory.SharedMemory(name=shm_name)
+		worker_shared.append(shm)
+		MarketBenchmark.share(scenario, names, np.ndarray(shape, dtype=np.float64, buffer=shm.buf))
+	worker_benchmark = MarketBenchmark()
+
+
+def sweep_chunk(
 		fun: typing.Callable,
-		alg_class,
-		scenario,
-		stocks_scenario,
-		result_type
-		):
-	"""deprecated"""
-	print(f"\t{i}: {len(params_list)} combs")
-	benchmark = MarketBenchmark()
-	best_result = None
-	best_params = []
-
-	for params in params_list:
-		stats = fun(
-			self=benchmark,
-			alg_class=alg_class,
-			scenario=scenario,
-			stocks_scenario=stocks_scenario,
-			params=params,
-			print_stats=False
+		alg_class: typing.ClassVar,
+		scenario: str,
+		stocks_scenario: list[str],
+		result_type: int,
+		top_k: int,
+		settle_scenario: str | None,
+		chunk: tuple[int, np.ndarray]
+		) -> tuple[int, list[tuple[list[float], float]], int]:
+	"""
+	index of the chunk of params vectors, its top_k (params, result) with the best first, and the size of the chunk.
+	with settle_scenario the trades are settled at its prices
+	"""
+	i, params = chunk
+	settle = {'settle_scenario': settle_scenario} if settle_scenario is not None else {}
+	if fun is MarketBenchmark.batched_stats_of_benchmark:
+		stats = worker_benchmark.batched_stats_of_benchmark(
+			alg_class=alg_class, scenario=scenario, stocks_scenario=stocks_scenario, params=params, **settle
 			)
+		results = stats_result(stats, result_type)
+	else:
+		results = np.array([
+			stats_result(
+				fun(self=worker_benchmark, alg_class=alg_class, scenario=scenario, stocks_scenario=stocks_scenario, params=p, print_stats=False, **settle),
+				result_type
+				)
+			for p in params.tolist()
+			])
+	# stable, so equal results keep the grid order
+	top = np.argsort(-results, kind="stable")[:top_k]
+	return i, [(params[j].tolist(), float(results[j])) for j in top], len(params)
+
 
-		if result_type == 0:
-			result = stats['tot capital']
-		elif result_type == 1:
-			result = stats['tot capital'] / (abs(stats['liquid']) + 1)
-		else:
-			result = stats['tot capital']
+class SweepCheckpoint:
+	"""
+	the chunks of a sweep already evaluated and the top_k results so far, saved to path at most every interval seconds.
+	a checkpoint of another sweep (a different signature) is not resumed
+	"""
 
-		if best_result is None:
-			best_result = result
-			best_params = params
+	def __init__(self, path: str, signature: dict[str, typing.Any], top_k: int = 1, interval: float = 30):
+		self.path = path
+		self.signature = json.loads(json.dumps(signature))
+		self.top_k = top_k
+		self.interval = interval
+		self.done: set[int] = set()
+		self.top: list[tuple[list[float], float]] = []
+		self.saved = time.time()
 
-		if result > best_result:
-			best_result = result
-			best_params = params
-	print("-", end="")
-	threads_results.append((best_params, best_result))
+	def load(self) -> bool:
+		"""resumes the checkpoint at path, if it is of this sweep"""
+		if not os.path.exists(self.path):
+			return False
+		with open(self.path, "r") as f:
+			state = json.load(f)
+		if state['signature'] != self.signature:
+			print(f"checkpoint {self.path} is of another sweep, starting over")
+			return False
+		self.done = set(state['done'])
+		self.top = [(p, r) for p, r in state['top']][:self.top_k]
+		return True
+
+	def add(self, i: int, top: list[tuple[list[float], float]]) -> None:
+		self.done.add(i)
+		self.top = sorted(self.top + top, key=lambda pr: -pr[1])[:self.top_k]
+		if time.time() - self.saved >= self.interval:
+			self.save()
+
+	def save(self) -> None:
+		os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+		tmp_path = f"{self.path}.tmp{os.getpid()}"
+		with open(tmp_path, "w+") as f:
+			json.dump({'signature': self.signature, 'done': sorted(self.done), 'top': self.top}, f)
+		os.replace(tmp_path, self.path)
+		self.saved = time.time()
+
+
+class SweepExecutor:
+	"""
+	evaluates params vectors on a process pool. the prices of the scenarios are put once in shared memory
+	and attached by every worker, the workers pull small chunks of params and send back only the best of each chunk
+	"""
+
+	def __init__(self, processes: int = None, chunk_size: int = 64):
+		self.processes = processes if processes is not None else mp.cpu_count()
+		self.chunk_size = chunk_size
+		self.shared: list[shared_memory.SharedMemory] = []
+		self.shared_info: dict[str, tuple[str, tuple[int, int], list[str]]] = {}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+	def share_scenario(self, scenario: str, stocks_scenario: list[str] = None) -> None:
+		benchmark = MarketBenchmark()
+		benchmark.load_scenario(scenario=scenario, stocks_scenario=stocks_scenario)
+		shm = shared_memory.SharedMemory(create=True, size=max(1, benchmark.prices.nbytes))
+		np.ndarray(benchmark.prices.shape, dtype=np.float64, buffer=shm.buf)[:] = benchmark.prices
+		self.shared.append(shm)
+		self.shared_info[scenario] = (shm.name, benchmark.prices.shape, [stock.name for stock in benchmark.stocks])
+
+	def close(self) -> None:
+		for shm in self.shared:
+			shm.close()
+			shm.unlink()
+		self.shared.clear()
+		self.shared_info.clear()
+
+	def imap(self, task: typing.Callable, items: typing.Iterable) -> typing.Iterator:
+		"""
+		task of every item on the pool, in completion order. the workers see the shared scenarios.
+		when profiling, what the workers record is merged in the profiler of this process
+		"""
+		profile_options = alg_profile.options()
+		if profile_options is not None:
+			task = functools.partial(alg_profile.profiled, task)
+		with mp.Pool(self.processes, initializer=attach_scenarios, initargs=(self.shared_info, profile_options)) as pool:
+			for result in pool.imap_unordered(task, items):
+				if profile_options is not None:
+					result, snapshot = result
+					alg_profile.profiler.merge(snapshot)
+				yield result
+
+	def best(
+			self,
+			fun: typing.Callable,
+			alg_class: typing.ClassVar,
+			params: ParamsGrid | np.ndarray,
+			scenario: str,
+			stocks_scenario: list[str] = None,
+			result_type: int = 0,
+			checkpoint: SweepCheckpoint = None,
+			settle_scenario: str = None
+			) -> tuple[list[float], float]:
+		"""
+		best params and result. with a checkpoint the chunks it has done are skipped, and every chunk done is added
+		to it: the checkpoint is saved when the sweep ends or is interrupted. with settle_scenario the strategies decide
+		on scenario and trade at the prices of settle_scenario
+		"""
+		if checkpoint is None:
+			checkpoint = SweepCheckpoint("", {}, interval=float("inf"))
+		n_chunks = -(-len(params) // self.chunk_size)
+		chunks = ((i, params[i * self.chunk_size:(i + 1) * self.chunk_size]) for i in range(n_chunks) if i not in checkpoint.done)
+		task = functools.partial(sweep_chunk, fun, alg_class, scenario, stocks_scenario, result_type, checkpoint.top_k, settle_scenario)
+
+		done = sum(min(self.chunk_size, len(params) - i * self.chunk_size) for i in checkpoint.done)
+		try:
+			for i, top, n in self.imap(task, chunks):
+				checkpoint.add(i, top)
+				done += n
+				print(f"\r\t{done}/{len(params)} combinations, best: {checkpoint.top[0][0]} -> {checkpoint.top[0][1]}", end="")
+		finally:
+			if checkpoint.path != "":
+				checkpoint.save()
+		print()
+		return checkpoint.top[0]
 
 
 def best_fitting_params_fun(
@@ -72,59 +258,65 @@ def best_fitting_params_fun(
 		scenario: str,
 		stocks_scenario: list[str] = None,
 		result_type: int = 0,
-		threading_scale: int = 4
+		threading_scale: int = 4,
+		shared_scenarios: list[str] = None,
+		chunk_size: int = 64,
+		shard: tuple[int, int] = None,
+		checkpoint: str = None,
+		resume: bool = False,
+		top_k: int = 1,
+		settle_scenario: str = None
 		) -> tuple[list[float], float]:
-	"""deprecated"""
-	global all_params
-
-	all_params = list()
-	recursive_params(bounds=bounds, iterations=iterations, params=[])
-
-	combinations = len(all_params)
-
-	print(f"checking {combinations} combinations: ")
-
-	threads = []
-	manager = mp.Manager()
-	threads_results = manager.list()
-	end_i = 0
-	step = int(combinations / threading_scale)
-	for i in range(threading_scale):
-		start_i = end_i
-		end_i += step
-		params_list = all_params[start_i:end_i]
-		threads.append(
-			mp.Process(
-				target=threading_combinations,
-				args=(threads_results, i, params_list, fun, alg_class, scenario, stocks_scenario, result_type)
-				)
-			)
+	"""
+	best params of the grid of bounds and iterations, or of the shard (start, stop) of its ranks.
+	with checkpoint the progress and the top_k results are saved to that file, with resume a sweep saved there
+	continues from where it stopped. with settle_scenario the trades are settled at its prices, aligned with scenario
+	"""
+	if shared_scenarios is None:
+		shared_scenarios = [scenario] + ([settle_scenario] if settle_scenario is not None else [])
 
-	if end_i < combinations - 1:
-		threads.append(
-			mp.Process(
-				target=threading_combinations,
-				args=(threads_results, threading_scale, all_params[end_i:], fun, alg_class, scenario, stocks_scenario, result_type)
-				)
-			)
+	params = ParamsGrid(bounds=bounds, iterations=iterations)
+	if shard is not None:
+		params = params.shard(*shard)
+	if len(params) == 0:
+		raise ValueError(f"shard {shard} has no params, the grid has {params.size} combinations")
 
-	for t in threads:
-		t.start()
+	sweep_checkpoint = None
+	if checkpoint is not None:
+		signature = {
+			'fun': fun.__qualname__,
+			'alg': f"{alg_class.__module__}.{alg_class.__qualname__}",
+			'bounds': bounds,
+			'iterations': iterations,
+			'scenario': scenario,
+			'stocks': sorted(stocks_scenario) if stocks_scenario is not None else None,
+			'result_type': result_type,
+			'shard': [params.start, params.stop],
+			'chunk_size': chunk_size
+			}
+		if settle_scenario is not None:
+			signature['settle'] = settle_scenario
+		sweep_checkpoint = SweepCheckpoint(checkpoint, signature, top_k=top_k)
+		if resume and sweep_checkpoint.load():
+			print(f"resuming {checkpoint}: {len(sweep_checkpoint.done)} chunks done")
 
-	for t in threads:
-		t.join()
-	print()
-	# print(threads_results)
-	br = threads_results[0][1]
-	bp: list = threads_results[0][0]
+	print(f"checking {len(params)} combinations on {threading_scale} processes: ")
 
-	for (par, res) in threads_results:
-		if res > br:
-			br = res
-			bp = par
+	with SweepExecutor(processes=threading_scale, chunk_size=chunk_size) as executor:
+		for s in shared_scenarios:
+			executor.share_scenario(s, stocks_scenario=stocks_scenario)
+		bp, br = executor.best(
+			fun,
+			alg_class,
+			params,
+			scenario,
+			stocks_scenario=stocks_scenario,
+			result_type=result_type,
+			checkpoint=sweep_checkpoint,
+			settle_scenario=settle_scenario
+			)
 
 	print(bp, br)
-	exit()
 	return [round(float(a), 2) for a in bp], br
 
 
@@ -135,17 +327,43 @@ def best_fitting_params(
 		scenario: str,
 		stocks_scenario: list[str] = None,
 		result_type: int = 0,
-		threading_scale: int = 4
+		threading_scale: int = 4,
+		shard: tuple[int, int] = None,
+		checkpoint: str = None,
+		resume: bool = False,
+		settle_scenario: str = None
 		) -> tuple[list[float], float]:
+	if implements(alg_class, "batched_buy_sell"):
+		return best_fitting_params_fun(
+			fun=MarketBenchmark.batched_stats_of_benchmark,
+			alg_class=alg_class,
+			bounds=bounds,
+			iterations=iterations,
+			scenario=scenario,
+			stocks_scenario=stocks_scenario,
+			result_type=result_type,
+			threading_scale=threading_scale,
+			chunk_size=1024,
+			shard=shard,
+			checkpoint=checkpoint,
+			resume=resume,
+			settle_scenario=settle_scenario
+			)
+
+	vectorized = implements(alg_class, "vectorized_moves")
 	return best_fitting_params_fun(
-		fun=MarketBenchmark.stats_of_benchmark,
+		fun=MarketBenchmark.vectorized_stats_of_benchmark if vectorized else MarketBenchmark.stats_of_benchmark,
 		alg_class=alg_class,
 		bounds=bounds,
 		iterations=iterations,
 		scenario=scenario,
 		stocks_scenario=stocks_scenario,
 		result_type=result_type,
-		threading_scale=threading_scale
+		threading_scale=threading_scale,
+		shard=shard,
+		checkpoint=checkpoint,
+		resume=resume,
+		settle_scenario=settle_scenario
 		)
 
 
@@ -164,17 +382,23 @@ def best_fitting_daily_params(
 		day: str,
 		stocks_scenario: list[str] = None,
 		result_type: int = 0,
-		threading_scale: int = 4
+		threading_scale: int = 4,
+		shard: tuple[int, int] = None,
+		checkpoint: str = None,
+		resume: bool = False
 		) -> tuple[list[float], float]:
-	print()
-
-	return best_fitting_params_fun(
-		fun=stats_output_daily_reproduce,
+	# decided on the normalized prices and settled at the real ones in the same pass, batched when the strategy can be
+	day = day.removeprefix('daily/')
+	return best_fitting_params(
 		alg_class=alg_class,
 		bounds=bounds,
 		iterations=iterations,
-		scenario=day,
+		scenario=f"daily/{day}_norm",
 		stocks_scenario=stocks_scenario,
 		result_type=result_type,
-		threading_scale=threading_scale
+		threading_scale=threading_scale,
+		shard=shard,
+		checkpoint=checkpoint,
+		resume=resume,
+		settle_scenario=f"daily/{day}"
 		)
@@ -1,3 +1,4 @@
+import contextlib
 import typing
 
 from matplotlib import pyplot as plt
@@ -5,36 +6,141 @@ from matplotlib import pyplot as plt
 import alg
 from alg_benchmark import MarketBenchmark
 from alg_best_fitter import best_fitting_params, best_fitting_daily_params
+from alg_monte_carlo import monte_carlo
+from alg_render import render_results
+from alg_result_cache import ResultCache
+from alg_search import SearchTrajectory, best_searched_params
+from alg_walk_forward import walk_forward
 
 
 class TestAlg:
-	def __init__(self, alg_class: typing.ClassVar, bounds: list[tuple[float, float]], iterations: list[int], threading_scale: int = 4):
+	def __init__(
+			self,
+			alg_class: typing.ClassVar,
+			bounds: list[tuple[float, float]],
+			iterations: list[int] = None,
+			threading_scale: int = 4,
+			search: str = "grid",
+			budget: int = 1000,
+			result_cache: str = None
+			):
+		"""
+		search is "grid" for the full np.linspace grid of iterations, or one of alg_search.searches with budget evaluations.
+		with result_cache the stats are cached in that sqlite file, and only the params never evaluated are run.
+		the cache is installed for the gen_* calls of this TestAlg only, the one in use before is restored after them
+		"""
+		self.result_cache = ResultCache(result_cache) if result_cache is not None else None
 		self.alg_class = alg_class
 		self.bounds = bounds
 		self.iterations = iterations
 		self.threading_scale = threading_scale
+		self.search = search
+		self.budget = budget
 
 		self.best_params_scenario: dict[str: tuple[list, float]] = {}
+		self.trajectories: dict[str: SearchTrajectory] = {}
+		self.walk_forward_results: dict[str: tuple[list[dict], dict]] = {}
+		self.monte_carlo_results: dict[str: dict[str, dict[str, float]]] = {}
 
-	def gen_best_params(self, scenario: str, stocks_scenario: list[str] = None):
-		self.best_params_scenario[scenario] = best_fitting_params(
-			alg_class=self.alg_class,
-			bounds=self.bounds,
-			iterations=self.iterations,
-			scenario=scenario,
-			stocks_scenario=stocks_scenario,
-			threading_scale=self.threading_scale
-			)
+	@contextlib.contextmanager
+	def cached(self) -> typing.Iterator[None]:
+		"""installs the result cache of this TestAlg (or none) on MarketBenchmark, and restores the previous one"""
+		previous, MarketBenchmark.result_cache = MarketBenchmark.result_cache, self.result_cache
+		try:
+			yield
+		finally:
+			MarketBenchmark.result_cache = previous
 
-	def gen_best_daily_params(self, day: str, stocks_scenario: list[str] = None):
-		self.best_params_scenario[f"daily/{day.removeprefix('daily/')}"] = best_fitting_daily_params(
-			alg_class=self.alg_class,
-			bounds=self.bounds,
-			iterations=self.iterations,
-			day=day,
-			stocks_scenario=stocks_scenario,
-			threading_scale=self.threading_scale
-			)
+	def checkpoint_path(self, scenario: str) -> str:
+		return f"./checkpoints/{self.alg_class.__name__}_{scenario.replace('/', '_')}.json"
+
+	def gen_best_params(self, scenario: str, stocks_scenario: list[str] = None, resume: bool = False):
+		"""grid sweeps are checkpointed, with resume a sweep of the same grid interrupted before goes on from its checkpoint"""
+		with self.cached():
+			if self.search != "grid":
+				self.best_params_scenario[scenario], self.trajectories[scenario] = best_searched_params(
+					alg_class=self.alg_class,
+					bounds=self.bounds,
+					scenario=scenario,
+					search=self.search,
+					budget=self.budget,
+					stocks_scenario=stocks_scenario
+					)
+				return
+
+			self.best_params_scenario[scenario] = best_fitting_params(
+				alg_class=self.alg_class,
+				bounds=self.bounds,
+				iterations=self.iterations,
+				scenario=scenario,
+				stocks_scenario=stocks_scenario,
+				threading_scale=self.threading_scale,
+				checkpoint=self.checkpoint_path(scenario),
+				resume=resume
+				)
+
+	def gen_best_daily_params(self, day: str, stocks_scenario: list[str] = None, resume: bool = False):
+		with self.cached():
+			if self.search != "grid":
+				scenario = f"daily/{day.removeprefix('daily/')}"
+				self.best_params_scenario[scenario], self.trajectories[scenario] = best_searched_params(
+					alg_class=self.alg_class,
+					bounds=self.bounds,
+					scenario=day,
+					search=self.search,
+					budget=self.budget,
+					stocks_scenario=stocks_scenario,
+					daily=True
+					)
+				return
+
+			self.best_params_scenario[f"daily/{day.removeprefix('daily/')}"] = best_fitting_daily_params(
+				alg_class=self.alg_class,
+				bounds=self.bounds,
+				iterations=self.iterations,
+				day=day,
+				stocks_scenario=stocks_scenario,
+				threading_scale=self.threading_scale,
+				checkpoint=self.checkpoint_path(f"daily/{day.removeprefix('daily/')}"),
+				resume=resume
+				)
+
+	def gen_walk_forward(
+			self,
+			scenario: str = "all_time",
+			train_len: int = 1000,
+			test_len: int = 250,
+			step: int = None,
+			stocks_scenario: list[str] = None
+			):
+		"""out of sample results: params fitted on rolling train windows of the scenario, tested on the window after each"""
+		with self.cached():
+			self.walk_forward_results[scenario] = walk_forward(
+				alg_class=self.alg_class,
+				bounds=self.bounds,
+				scenario=scenario,
+				train_len=train_len,
+				test_len=test_len,
+				step=step,
+				stocks_scenario=stocks_scenario,
+				search=self.search,
+				budget=self.budget,
+				iterations=self.iterations,
+				processes=self.threading_scale
+				)
+
+	def gen_monte_carlo(self, scenario: str, n_paths: int = 1000, generator: str = "bootstrap", stocks_scenario: list[str] = None):
+		"""distribution of the results of the best params of scenario over n_paths resampled versions of it"""
+		with self.cached():
+			self.monte_carlo_results[scenario] = monte_carlo(
+				alg_class=self.alg_class,
+				params=self.best_params_scenario[scenario][0],
+				scenario=scenario,
+				stocks_scenario=stocks_scenario,
+				n_paths=n_paths,
+				generator=generator,
+				processes=self.threading_scale
+				)
 
 	def print_best_params(self):
 		with open(f"./logs/{self.alg_class.__name__}_params", "w+") as log_file:
@@ -43,8 +149,32 @@ class TestAlg:
 				print(f"\t-{scenario}:\t{params} -> {result}")
 				log_file.write(f"{scenario}: {params} -> {result}\n")
 
-	def launch_benchmark(self, stocks_scenario: list[str] = None):
+	def launch_benchmark(
+			self,
+			stocks_scenario: list[str] = None,
+			out_dir: str = None,
+			fmt: str = "png",
+			downsample: str = "lttb"
+			):
+		"""
+		shows the figure of every best params. with out_dir the figures are rendered headless to fmt files there instead,
+		in parallel, and with the series downsampled
+		"""
 		print("\n")
+		if out_dir is not None:
+			paths = render_results(
+				self.alg_class,
+				{scenario: params for scenario, (params, _) in self.best_params_scenario.items()},
+				out_dir=out_dir,
+				fmt=fmt,
+				downsample=downsample,
+				stocks_scenario=stocks_scenario,
+				processes=self.threading_scale
+				)
+			for path in paths:
+				print(f"\t{path}")
+			return
+
 		benchmark = MarketBenchmark()
 		for scenario, (params, result) in self.best_params_scenario.items():
 			if scenario.startswith("daily/"):
@@ -0,0 +1,120 @@
+import atexit
+import datetime
+import os
+import queue
+import threading
+import time
+
+
+class LogWriter:
+	"""
+	background writer of a log file: log() only queues the message and its args, the writer thread formats
+	the queued records in batches and writes them with a single write. the file is opened at the first record
+	and rotated to path.1 ... path.<backup_count> when it would get bigger than max_bytes.
+	one writer per path, shared by all the strategies logging there
+	"""
+	writers: dict[str, "LogWriter"] = {}
+	lock = threading.Lock()
+
+	def __init__(self, path: str, max_bytes: int, backup_count: int):
+		self.path = path
+		self.max_bytes = max_bytes
+		self.backup_count = backup_count
+		self.users = 0
+		self.file = None
+		self.queue: queue.SimpleQueue = queue.SimpleQueue()
+		self.thread = threading.Thread(target=self.run, name=f"log {path}", daemon=True)
+		self.thread.start()
+
+	@classmethod
+	def acquire(cls, path: str, max_bytes: int = 64 * 1024 * 1024, backup_count: int = 3) -> "LogWriter":
+		with cls.lock:
+			if path not in cls.writers:
+				cls.writers[path] = LogWriter(path, max_bytes, backup_count)
+			writer = cls.writers[path]
+			writer.users += 1
+			return writer
+
+	def release(self) -> None:
+		with LogWriter.lock:
+			self.users -= 1
+			if self.users > 0:
+				return
+			LogWriter.writers.pop(self.path, None)
+		self.stop()
+
+	def stop(self) -> None:
+		"""writes what is left in the queue and closes the file"""
+		self.queue.put(None)
+		self.thread.join()
+
+	def write(self, tick: int, msg: str, args: tuple) -> None:
+		self.queue.put((time.time(), tick, msg, args))
+
+	def run(self) -> None:
+		second, prefix = None, ""
+		while True:
+			records = [self.queue.get()]
+			while records[-1] is not None and len(records) < 4096:
+				try:
+					records.append(self.queue.get_nowait())
+				except queue.Empty:
+					break
+
+			lines = []
+			for record in records:
+				if record is None:
+					continue
+				t, tick, msg, args = record
+				if int(t) != second:
+					second = int(t)
+					prefix = datetime.datetime.fromtimestamp(second).strftime("%Y/%m/%d_%H:%M:%S")
+				try:
+					text = msg % args if args else msg
+				except Exception as e:
+					# a record that does not format must not stop the writer of everyone else logging there
+					text = f"unformattable record {record!r}: {e!r}"
+				lines.append(f"{prefix}.{int((t - second) * 1e6):06d} tick{tick}\t{text}\n")
+			if len(lines) > 0:
+				self.write_lines(lines)
+
+			if records[-1] is None:
+				if self.file is not None:
+					self.file.close()
+					self.file = None
+				return
+
+	def write_lines(self, lines: list[str]) -> None:
+		if self.file is None:
+			self.file = open(self.path, "a")
+		size = self.file.tell()
+		chunk = []
+		for line in lines:
+			if 0 < self.max_bytes < size + len(line) and size > 0:
+				self.file.write("".join(chunk))
+				chunk = []
+				self.rotate()
+				size = 0
+			chunk.append(line)
+			size += len(line)
+		self.file.write("".join(chunk))
+
+	def rotate(self) -> None:
+		self.file.close()
+		for i in range(self.backup_count - 1, 0, -1):
+			if os.path.exists(f"{self.path}.{i}"):
+				os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+		if self.backup_count > 0:
+			os.replace(self.path, f"{self.path}.1")
+		else:
+			os.remove(self.path)
+		self.file = open(self.path, "a")
+
+
+@atexit.register
+def stop_writers() -> None:
+	with LogWriter.lock:
+		writers = list(LogWriter.writers.values())
+		LogWriter.writers.clear()
+	for writer in writers:
+		writer.stop()
@@ -0,0 +1,190 @@
+"""
+robustness of fitted params: the strategy runs on many synthetic or block-bootstrapped versions of a scenario.
+the workers generate their own paths from the shared prices of the scenario and a seed, and send back three numbers
+per path, that are aggregated as they arrive: memory doesn't grow with the number of paths
+"""
+import functools
+import math
+import typing
+
+import numpy as np
+
+from alg_benchmark import MarketBenchmark
+from alg_best_fitter import SweepExecutor, implements
+from market import gbm_model
+
+measures = ['tot capital', 'max drawdown', 'n transactions']
+
+
+class StreamingStats:
+	"""count, mean, std, min and max of a stream of values, and quantiles of a fixed size uniform reservoir of them"""
+
+	def __init__(self, reservoir_size: int = 10000, seed: int = None):
+		self.n = 0
+		self.mean = 0.0
+		self.m2 = 0.0
+		self.min = math.inf
+		self.max = -math.inf
+		self.reservoir = np.empty(reservoir_size, dtype=np.float64)
+		self.rng = np.random.default_rng(seed)
+
+	def update(self, values: np.ndarray) -> None:
+		if len(values) == 0:
+			return
+		# merge of the mean and the sum of squared deviations of the batch (chan et al.)
+		n, mean = len(values), float(values.mean())
+		delta = mean - self.mean
+		self.m2 += float(((values - mean) ** 2).sum()) + delta ** 2 * self.n * n / (self.n + n)
+		self.mean += delta * n / (self.n + n)
+		self.min, self.max = min(self.min, float(values.min())), max(self.max, float(values.max()))
+
+		# algorithm R: the value j of the stream replaces a random slot with probability size / (j + 1)
+		size = len(self.reservoir)
+		fill = max(0, min(n, size - self.n))
+		self.reservoir[self.n:self.n + fill] = values[:fill]
+		j = self.n + np.arange(fill, n)
+		slots = (self.rng.random(len(j)) * (j + 1)).astype(np.int64)
+		kept = slots < size
+		self.reservoir[slots[kept]] = values[fill:][kept]
+		self.n += n
+
+	def summary(self, quantiles: tuple[float, ...] = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)) -> dict[str, float]:
+		sample = self.reservoir[:min(self.n, len(self.reservoir))]
+		summary = {
+			'paths': self.n,
+			'mean': round(self.mean, 2),
+			'std': round(math.sqrt(self.m2 / self.n), 2) if self.n > 0 else 0.0,
+			'min': self.min,
+			'max': self.max
+			}
+		for q, v in zip(quantiles, np.quantile(sample, quantiles).tolist() if len(sample) > 0 else [math.nan] * len(quantiles)):
+			summary[f"p{round(q * 100)}"] = round(v, 2)
+		return summary
+
+
+def log_returns(prices: np.ndarray) -> np.ndarray:
+	if (prices <= 0).any():
+		raise ValueError("log returns of non positive prices")
+	return np.diff(np.log(prices), axis=1)
+
+
+def bootstrap_paths(prices: np.ndarray, n_paths: int, rng: np.random.Generator, block_len: int = 20) -> np.ndarray:
+	"""
+	(n_paths, n_stocks, time_len) paths from the first prices, with the log returns resampled in blocks of block_len
+	consecutive ticks. the blocks are the same for all the stocks, so their correlation is kept
+	"""
+	returns = log_returns(prices)
+	n_steps = returns.shape[1]
+	block_len = max(1, min(block_len, n_steps))
+	n_blocks = -(-n_steps // block_len)
+	starts = rng.integers(0, n_steps - block_len + 1, (n_paths, n_blocks))
+	index = (starts[:, :, None] + np.arange(block_len)).reshape(n_paths, -1)[:, :n_steps]
+
+	paths = np.empty((n_paths, prices.shape[0], prices.shape[1]))
+	paths[:, :, 0] = 0
+	np.cumsum(np.moveaxis(returns[:, index], 0, 1), axis=-1, out=paths[:, :, 1:])
+	np.exp(paths, out=paths)
+	paths *= prices[:, 0][:, None]
+	return paths
+
+
+def synthetic_paths(prices: np.ndarray, n_paths: int, rng: np.random.Generator, jumps: bool = False) -> np.ndarray:
+	"""gbm paths with the drift and the volatility of the log returns of every stock, from its first price"""
+	returns = log_returns(prices)
+	sigma = returns.std(axis=1)
+	kwargs = {'jump_rate': 0.01, 'jump_mean': -0.03, 'jump_std': 0.08} if jumps else {}
+	return gbm_model(
+		rng,
+		(n_paths, prices.shape[0]),
+		prices.shape[1],
+		mu=returns.mean(axis=1) + sigma ** 2 / 2,
+		sigma=sigma,
+		start=(prices[:, 0], prices[:, 0]),
+		**kwargs
+		)
+
+
+path_generators: dict[str, typing.Callable] = {
+	"bootstrap": bootstrap_paths,
+	"gbm": synthetic_paths,
+	"jump": functools.partial(synthetic_paths, jumps=True)
+	}
+
+
+def monte_carlo_chunk(
+		alg_class: typing.ClassVar,
+		params: list,
+		scenario: str,
+		generator: str,
+		seed: int,
+		start: int,
+		chunk: tuple[int, int]
+		) -> dict[str, np.ndarray]:
+	"""measures of the paths of a chunk, that are generated from (seed, chunk index)"""
+	chunk_i, n_paths = chunk
+	_, prices = MarketBenchmark.shared_scenarios[scenario]
+	paths = path_generators[generator](prices, n_paths, np.random.default_rng([seed, chunk_i]))
+
+	if implements(alg_class, "vectorized_moves"):
+		fun = MarketBenchmark.vectorized_stats_of_benchmark
+	else:
+		fun = MarketBenchmark.stats_of_benchmark
+	benchmark = MarketBenchmark()
+	results = {m: np.empty(n_paths) for m in measures}
+	names = MarketBenchmark.shared_scenarios[scenario][0]
+	# a prefix per chunk: a scenario name is never reused for different prices
+	sims = MarketBenchmark.share_paths(paths, prefix=f"{scenario}/mc{chunk_i}", names=names)
+	# the stats of a synthetic path are never asked again, caching them would only fill the result cache
+	result_cache, MarketBenchmark.result_cache = MarketBenchmark.result_cache, None
+	try:
+		for i, sim in enumerate(sims):
+			stats = fun(self=benchmark, alg_class=alg_class, scenario=sim, params=params, start=start)
+			for m in measures:
+				results[m][i] = stats[m]
+	finally:
+		MarketBenchmark.result_cache = result_cache
+		for sim in sims:
+			MarketBenchmark.shared_scenarios.pop(sim, None)
+			MarketBenchmark.shared_versions.pop(sim, None)
+	return results
+
+
+def monte_carlo(
+		alg_class: typing.ClassVar,
+		params: list,
+		scenario: str = "all_time",
+		stocks_scenario: list[str] = None,
+		n_paths: int = 1000,
+		generator: str = "bootstrap",
+		seed: int = 0,
+		start: int = 20,
+		chunk_size: int = 16,
+		processes: int = None,
+		print_stats: bool = True
+		) -> dict[str, dict[str, float]]:
+	"""
+	distribution of tot capital, max drawdown and n transactions of params over n_paths versions of the scenario
+	made by path_generators[generator]. the same seed and chunk_size give the same paths
+	"""
+	aggregates = {m: StreamingStats(seed=seed) for m in measures}
+	profitable = 0
+	chunks = [(i, min(chunk_size, n_paths - i * chunk_size)) for i in range(-(-n_paths // chunk_size))]
+	print(f"monte carlo {alg_class.__name__} {params} on {n_paths} {generator} paths of {scenario}: ")
+	with SweepExecutor(processes=processes) as executor:
+		executor.share_scenario(scenario, stocks_scenario)
+		task = functools.partial(monte_carlo_chunk, alg_class, params, scenario, generator, seed, start)
+		for results in executor.imap(task, chunks):
+			for m in measures:
+				aggregates[m].update(results[m])
+			profitable += int((results['tot capital'] > 0).sum())
+			tot = aggregates['tot capital']
+			print(f"\r\t{tot.n}/{n_paths} paths, tot capital {tot.mean:.2f} +- {math.sqrt(tot.m2 / tot.n):.2f}", end="")
+	print()
+
+	summary = {m: aggregates[m].summary() for m in measures}
+	summary['tot capital']['profitable'] = round(profitable / max(1, n_paths), 4)
+	if print_stats:
+		print(f"-----{alg_class.__name__} monte carlo-----")
+		for m, s in summary.items():
+			print(f"{m}: {s}")
+	return summary
@@ -0,0 +1,191 @@
+"""
+opt-in instrumentation of the backtest hot path. enable() wraps the phases (the methods in targets, and buy_sell of
+every strategy) with timers and counters, disable() puts the original methods back: when it is off nothing is wrapped
+and nothing is paid. SweepExecutor workers profile with the same options and send back what they recorded, that is
+merged in the profiler of the main process. the summary can be printed or exported as a chrome trace (about:tracing)
+"""
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import typing
+
+import alg
+from alg_benchmark import MarketBenchmark
+
+targets: list[tuple[type, str]] = [
+	(MarketBenchmark, "load_scenario"),
+	(MarketBenchmark, "cycle"),
+	(MarketBenchmark, "stats_of_benchmark"),
+	(MarketBenchmark, "vectorized_stats_of_benchmark"),
+	(MarketBenchmark, "batched_stats_of_benchmark"),
+	(alg.AlgorithmStrategy, "tick"),
+	(alg.AlgorithmStrategy, "trade"),
+	(alg.AlgorithmStrategy, "update_history"),
+	(alg.AlgorithmStrategy, "log"),
+	(alg.BatchedAlgorithm, "tick"),
+	(alg.BatchedAlgorithm, "run")
+	]
+
+
+class Profiler:
+	"""calls, wall time and allocated bytes of every phase, trades per tick and, with trace, the timeline of the calls"""
+
+	def __init__(self, trace: bool = False, allocations: bool = False, max_events: int = 1_000_000):
+		self.trace = trace
+		self.allocations = allocations
+		self.max_events = max_events
+		# phase -> [calls, total ns, max ns, allocated bytes]
+		self.phases: dict[str, list[int]] = {}
+		self.trades_per_tick: collections.Counter = collections.Counter()
+		# (phase, start ns, duration ns, pid, tid)
+		self.events: list[tuple[str, int, int, int, int]] = []
+
+	def options(self) -> dict[str, typing.Any]:
+		return {'trace': self.trace, 'allocations': self.allocations, 'max_events': self.max_events}
+
+	def record(self, phase: str, start: int, duration: int, allocated: int) -> None:
+		stats = self.phases.get(phase)
+		if stats is None:
+			stats = self.phases[phase] = [0, 0, 0, 0]
+		stats[0] += 1
+		stats[1] += duration
+		if duration > stats[2]:
+			stats[2] = duration
+		stats[3] += allocated
+		if self.trace and len(self.events) < self.max_events:
+			self.events.append((phase, start, duration, os.getpid(), threading.get_ident()))
+
+	def snapshot(self) -> dict[str, typing.Any]:
+		return {'phases': self.phases, 'trades per tick': dict(self.trades_per_tick), 'events': self.events}
+
+	def merge(self, snapshot: dict[str, typing.Any]) -> None:
+		for phase, (calls, total, longest, allocated) in snapshot['phases'].items():
+			stats = self.phases.setdefault(phase, [0, 0, 0, 0])
+			stats[0] += calls
+			stats[1] += total
+			stats[2] = max(stats[2], longest)
+			stats[3] += allocated
+		self.trades_per_tick.update(snapshot['trades per tick'])
+		self.events += snapshot['events'][:max(0, self.max_events - len(self.events))]
+
+	def print_summary(self) -> None:
+		"""the phases by total time, which includes the time of the phases called inside them"""
+		rows = sorted(self.phases.items(), key=lambda item: -item[1][1])
+		width = max([len("phase")] + [len(phase) for phase in self.phases])
+		print(f"{'phase':<{width}} | {'calls':>10} | {'total s':>10} | {'mean us':>10} | {'max us':>10} | {'alloc KB':>10}")
+		for phase, (calls, total, longest, allocated) in rows:
+			print(f"{phase:<{width}} | {calls:>10} | {total / 1e9:>10.4f} | {total / calls / 1e3:>10.2f} | {longest / 1e3:>10.2f} | {allocated / 1024:>10.1f}")
+
+		ticks = sum(self.trades_per_tick.values())
+		if ticks > 0:
+			trades = sum(n * count for n, count in self.trades_per_tick.items())
+			print(f"trades per tick: {trades / ticks:.3f} over {ticks} ticks, {dict(sorted(self.trades_per_tick.items()))}")
+
+	def export_trace(self, path: str) -> None:
+		"""chrome trace event format, one complete event per recorded call"""
+		events = [
+			{'name': phase, 'ph': "X", 'ts': start / 1e3, 'dur': duration / 1e3, 'pid': pid, 'tid': tid}
+			for phase, start, duration, pid, tid in self.events
+			]
+		with open(path, "w+") as f:
+			json.dump({'traceEvents': events, 'displayTimeUnit': "ms"}, f)
+
+
+profiler: Profiler | None = None
+patched: list[tuple[type, str, typing.Callable]] = []
+
+
+def timed(original: typing.Callable, phase: str) -> typing.Callable:
+	@functools.wraps(original)
+	def wrapper(*args, **kwargs):
+		p = profiler
+		if p is None:
+			return original(*args, **kwargs)
+		allocated = tracemalloc.get_traced_memory()[0] if p.allocations else 0
+		start = time.perf_counter_ns()
+		try:
+			return original(*args, **kwargs)
+		finally:
+			duration = time.perf_counter_ns() - start
+			p.record(phase, start, duration, tracemalloc.get_traced_memory()[0] - allocated if p.allocations else 0)
+	return wrapper
+
+
+def timed_tick(original: typing.Callable, phase: str) -> typing.Callable:
+	"""timed AlgorithmStrategy.tick, that also counts the trades of the tick"""
+	wrapper = timed(original, phase)
+
+	@functools.wraps(original)
+	def tick(self: alg.AlgorithmStrategy):
+		p = profiler
+		n_moves = len(self.moves)
+		wrapper(self)
+		if p is not None:
+			p.trades_per_tick[len(self.moves) - n_moves] += 1
+	return tick
+
+
+def strategy_classes(cls: type = alg.AlgorithmStrategy) -> list[type]:
+	classes = [cls]
+	for sub in cls.__subclasses__():
+		classes += strategy_classes(sub)
+	return classes
+
+
+def enable(trace: bool = False, allocations: bool = False, max_events: int = 1_000_000) -> Profiler:
+	"""starts a new profiler, the phases are wrapped the first time"""
+	global profiler
+	profiler = Profiler(trace=trace, allocations=allocations, max_events=max_events)
+	if allocations and not tracemalloc.is_tracing():
+		tracemalloc.start()
+	if len(patched) > 0:
+		return profiler
+
+	phases = targets + [(cls, "buy_sell") for cls in strategy_classes() if "buy_sell" in cls.__dict__]
+	for owner, name in phases:
+		original = owner.__dict__[name]
+		phase = f"{owner.__name__}.{name}"
+		wrap = timed_tick if (owner, name) == (alg.AlgorithmStrategy, "tick") else timed
+		setattr(owner, name, wrap(original, phase))
+		patched.append((owner, name, original))
+	return profiler
+
+
+def disable() -> Profiler | None:
+	"""puts the original methods back, returns the profiler with what it recorded"""
+	global profiler
+	for owner, name, original in reversed(patched):
+		setattr(owner, name, original)
+	patched.clear()
+	if tracemalloc.is_tracing():
+		tracemalloc.stop()
+	p, profiler = profiler, None
+	return p
+
+
+@contextlib.contextmanager
+def profile(trace: bool = False, allocations: bool = False, max_events: int = 1_000_000) -> typing.Iterator[Profiler]:
+	p = enable(trace=trace, allocations=allocations, max_events=max_events)
+	try:
+		yield p
+	finally:
+		disable()
+
+
+def options() -> dict[str, typing.Any] | None:
+	"""the options of the running profiler, None when profiling is off"""
+	return profiler.options() if profiler is not None else None
+
+
+def profiled(task: typing.Callable, item: typing.Any) -> tuple[typing.Any, dict[str, typing.Any]]:
+	"""runs task(item) in a worker and returns its result with what the worker recorded since the last task"""
+	global profiler
+	result = task(item)
+	snapshot = profiler.snapshot()
+	profiler = Profiler(**profiler.options())
+	return result, snapshot
@@ -0,0 +1,72 @@
+"""
+figures of backtest results written to png or svg files without a display: every figure is drawn on its own Agg
+canvas, out of pyplot, so the workers of a pool render a batch of results at once. the series are downsampled
+(market.downsamplers) before being plotted, drawing thousands of points per line is most of the time of a figure
+"""
+import functools
+import os
+import typing
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from alg_benchmark import MarketBenchmark
+from alg_best_fitter import SweepExecutor
+
+
+def render(draw: typing.Callable[[Figure], typing.Any], path: str, size: tuple[float, float] = (13.5, 8.5), dpi: int = 100) -> str:
+	"""draws on a new Agg figure with draw(fig) and saves it to path, the format is the extension of path"""
+	fig = Figure(figsize=size, dpi=dpi)
+	FigureCanvasAgg(fig)
+	draw(fig)
+	fig.savefig(path)
+	return path
+
+
+def figure_path(out_dir: str, alg_class: typing.ClassVar, scenario: str, fmt: str) -> str:
+	return os.path.join(out_dir, f"{alg_class.__name__}_{scenario.replace('/', '_')}.{fmt}")
+
+
+def render_result(
+		alg_class: typing.ClassVar,
+		out_dir: str,
+		fmt: str,
+		downsample: str,
+		n_points: int,
+		stocks_scenario: list[str],
+		start: int,
+		item: tuple[str, list]
+		) -> str:
+	"""runs the (scenario, params) of item and renders its figure. daily scenarios are decided on the norm prices and settled at the real ones"""
+	scenario, params = item
+	benchmark = MarketBenchmark()
+	if scenario.startswith("daily/"):
+		day = scenario.removeprefix("daily/")
+		a = benchmark.run_strategy(
+			alg_class, scenario=f"daily/{day}_norm", stocks_scenario=stocks_scenario, start=start, settle_scenario=f"daily/{day}", params=params
+			)
+	else:
+		a = benchmark.run_strategy(alg_class, scenario=scenario, stocks_scenario=stocks_scenario, start=start, params=params)
+	return render(
+		lambda fig: a.gen_fig(fig=fig, downsample=downsample, n_points=n_points),
+		figure_path(out_dir, alg_class, scenario, fmt)
+		)
+
+
+def render_results(
+		alg_class: typing.ClassVar,
+		results: dict[str, list],
+		out_dir: str = "./figures",
+		fmt: str = "png",
+		downsample: str = "lttb",
+		n_points: int = 2000,
+		stocks_scenario: list[str] = None,
+		start: int = 20,
+		processes: int = None
+		) -> list[str]:
+	"""the figure of every scenario -> params of results, rendered to out_dir by a pool of workers. returns the paths"""
+	os.makedirs(out_dir, exist_ok=True)
+	task = functools.partial(render_result, alg_class, out_dir, fmt, downsample, n_points, stocks_scenario, start)
+	with SweepExecutor(processes=processes) as executor:
+		paths = list(executor.imap(task, list(results.items())))
+	return sorted(paths)
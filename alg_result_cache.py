@@ -0,0 +1,172 @@
+"""
+persistent cache of backtest results in a sqlite file, shared by all the processes: the workers of a pool write to it
+concurrently (wal journal, writers wait for each other). the key is content-addressed: the strategy class and the hash
+of its code, the params quantized to step, the hash of the prices and names of the scenario, start and the hash of the
+transaction cost model. when the file gets bigger than max_bytes the least recently used results are evicted
+"""
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sqlite3
+import time
+import typing
+
+import numpy as np
+
+import alg
+
+
+def source_hash(*objects: typing.Any) -> str:
+	h = hashlib.sha256()
+	for obj in objects:
+		try:
+			h.update(inspect.getsource(obj).encode())
+		except (OSError, TypeError):
+			h.update(f"{getattr(obj, '__module__', '')}.{getattr(obj, '__qualname__', repr(obj))}".encode())
+	return h.hexdigest()
+
+
+def code_version(alg_class: typing.ClassVar, kind: str) -> str:
+	"""
+	hash of the code of alg_class and of its bases, and of BatchedAlgorithm for batched results.
+	the classes made by alg_spec.compile_spec share their code, their spec tells them apart
+	"""
+	classes = [cls for cls in alg_class.__mro__ if cls is not object]
+	if kind == "batched":
+		classes.append(alg.BatchedAlgorithm)
+	version = source_hash(*classes)
+	if hasattr(alg_class, "spec"):
+		version = hashlib.sha256((version + alg_class.spec).encode()).hexdigest()
+	return version
+
+
+def scenario_hash(names: list[str], prices: np.ndarray) -> str:
+	h = hashlib.sha256(json.dumps(list(names)).encode())
+	h.update(np.ascontiguousarray(prices, dtype=np.float64).tobytes())
+	return h.hexdigest()
+
+
+def quantize(params: typing.Iterable[float], step: float) -> list[int]:
+	return [int(round(float(p) / step)) for p in params]
+
+
+class ResultCache:
+	def __init__(self, path: str = "./cache/results.sqlite", max_bytes: int = 1024 * 1024 * 1024, step: float = 1e-6):
+		self.path = path
+		self.max_bytes = max_bytes
+		self.step = step
+		self.pid = None
+		self.db: sqlite3.Connection | None = None
+		self.versions: dict[tuple[typing.ClassVar, str], str] = {}
+		self.scenario_hashes: dict[tuple, str] = {}
+		self.cost_hash = source_hash(alg.transaction_cost)
+		self.n_puts = 0
+		self.hits = 0
+		self.misses = 0
+
+	def connect(self) -> sqlite3.Connection:
+		# a connection can't cross a fork: every process opens its own
+		if self.db is None or self.pid != os.getpid():
+			os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+			self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+			self.db.execute("PRAGMA journal_mode=WAL")
+			self.db.execute("PRAGMA synchronous=NORMAL")
+			self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, stats BLOB, size INTEGER, used REAL)")
+			self.db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+			self.pid = os.getpid()
+		return self.db
+
+	def __getstate__(self) -> dict:
+		state = self.__dict__.copy()
+		state['db'], state['pid'] = None, None
+		return state
+
+	def prices_hash(self, names: list[str], prices: np.ndarray, memo: tuple = None) -> str:
+		"""
+		the hash of the scenario of a result. memo identifies prices that can't change (a scenario file at a given mtime),
+		so their hash is computed once
+		"""
+		if memo is None:
+			return scenario_hash(names, prices)
+		if memo not in self.scenario_hashes:
+			self.scenario_hashes[memo] = scenario_hash(names, prices)
+		return self.scenario_hashes[memo]
+
+	def key(self, kind: str, alg_class: typing.ClassVar, params: typing.Iterable[float], prices_hash: str, start: int) -> str:
+		"""the key of a result of params on the scenario of prices_hash (see prices_hash())"""
+		if (alg_class, kind) not in self.versions:
+			self.versions[alg_class, kind] = code_version(alg_class, kind)
+
+		content = [
+			kind,
+			f"{alg_class.__module__}.{alg_class.__qualname__}",
+			self.versions[alg_class, kind],
+			quantize(params, self.step),
+			prices_hash,
+			start,
+			self.cost_hash
+			]
+		return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+	def get_many(self, keys: list[str]) -> dict[str, typing.Any]:
+		"""the cached results of keys, the missing ones are left out"""
+		db = self.connect()
+		found = {}
+		for i in range(0, len(keys), 500):
+			chunk = keys[i:i + 500]
+			rows = db.execute(f"SELECT key, stats FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+			found.update((key, pickle.loads(blob)) for key, blob in rows)
+			if len(rows) > 0:
+				with db:
+					db.execute("BEGIN IMMEDIATE")
+					db.executemany("UPDATE results SET used = ? WHERE key = ?", [(time.time(), key) for key, _ in rows])
+		self.hits += len(found)
+		self.misses += len(keys) - len(found)
+		return found
+
+	def get(self, key: str) -> typing.Any | None:
+		return self.get_many([key]).get(key)
+
+	def put_many(self, results: dict[str, typing.Any]) -> None:
+		db = self.connect()
+		now = time.time()
+		rows = []
+		for key, stats in results.items():
+			blob = pickle.dumps(stats, protocol=pickle.HIGHEST_PROTOCOL)
+			rows.append((key, blob, len(blob), now))
+		with db:
+			db.execute("BEGIN IMMEDIATE")
+			db.executemany("INSERT OR REPLACE INTO results (key, stats, size, used) VALUES (?, ?, ?, ?)", rows)
+
+		self.n_puts += len(rows)
+		if self.n_puts >= 1000:
+			self.n_puts = 0
+			self.evict()
+
+	def put(self, key: str, stats: typing.Any) -> None:
+		self.put_many({key: stats})
+
+	def evict(self) -> None:
+		"""drops the least recently used results until they take less than 90% of max_bytes"""
+		db = self.connect()
+		with db:
+			db.execute("BEGIN IMMEDIATE")
+			size = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+			if size <= self.max_bytes:
+				return
+			to_free = size - 0.9 * self.max_bytes
+			freed = 0
+			keys = []
+			for key, n in db.execute("SELECT key, size FROM results ORDER BY used"):
+				keys.append((key,))
+				freed += n
+				if freed >= to_free:
+					break
+			db.executemany("DELETE FROM results WHERE key = ?", keys)
+
+	def clear(self) -> None:
+		db = self.connect()
+		db.execute("DELETE FROM results")
+		db.execute("VACUUM")
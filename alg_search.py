@@ -0,0 +1,237 @@
+import math
+import typing
+
+import numpy as np
+
+from alg_benchmark import MarketBenchmark
+from alg_best_fitter import ParamsGrid, implements, stats_result
+
+
+class ParamsEvaluator:
+	"""results of batches of params vectors on one scenario, counting every vector evaluated"""
+
+	def __init__(
+			self,
+			alg_class: typing.ClassVar,
+			scenario: str,
+			stocks_scenario: list[str] = None,
+			result_type: int = 0,
+			daily: bool = False,
+			start: int = 20
+			):
+		self.alg_class = alg_class
+		self.scenario = scenario
+		self.stocks_scenario = stocks_scenario
+		self.result_type = result_type
+		self.daily = daily
+		# a day is decided on its normalized prices and settled at the real ones
+		self.settle_scenario = None
+		if daily:
+			day = scenario.removeprefix('daily/')
+			self.scenario, self.settle_scenario = f"daily/{day}_norm", f"daily/{day}"
+		self.start = start
+		self.benchmark = MarketBenchmark()
+		self.n_evaluations = 0
+
+	def history_len(self) -> int:
+		self.benchmark.load_scenario(
+			scenario=self.scenario, stocks_scenario=self.stocks_scenario, start=self.start, settle_scenario=self.settle_scenario
+			)
+		return self.benchmark.prices.shape[1]
+
+	def __call__(self, params: np.ndarray, fraction: float = 1) -> np.ndarray:
+		"""
+		results of every row of params. with fraction < 1 only the first part of the history is used,
+		when the strategy can be batched (the others are always evaluated on the whole scenario)
+		"""
+		self.n_evaluations += len(params)
+
+		if implements(self.alg_class, "batched_buy_sell"):
+			end = None if fraction >= 1 else max(self.start + 2, int(self.history_len() * fraction))
+			stats = self.benchmark.batched_stats_of_benchmark(
+				alg_class=self.alg_class,
+				scenario=self.scenario,
+				stocks_scenario=self.stocks_scenario,
+				params=params,
+				start=self.start,
+				end=end,
+				settle_scenario=self.settle_scenario
+				)
+			return stats_result(stats, self.result_type)
+
+		if implements(self.alg_class, "vectorized_moves"):
+			fun = MarketBenchmark.vectorized_stats_of_benchmark
+		else:
+			fun = MarketBenchmark.stats_of_benchmark
+
+		results = []
+		for p in params.tolist():
+			stats = fun(
+				self=self.benchmark,
+				alg_class=self.alg_class,
+				scenario=self.scenario,
+				stocks_scenario=self.stocks_scenario,
+				params=p,
+				start=self.start,
+				print_stats=False,
+				settle_scenario=self.settle_scenario
+				)
+			results.append(stats_result(stats, self.result_type))
+		return np.array(results, dtype=np.float64)
+
+
+class SearchTrajectory:
+	"""best-so-far params and result after every batch of evaluations of a search"""
+
+	def __init__(self, name: str, evaluate: ParamsEvaluator):
+		self.name = name
+		self.evaluate = evaluate
+		self.best_params: list[float] | None = None
+		self.best_result: float | None = None
+		self.history: list[tuple[int, float, list[float]]] = []
+
+	def update(self, params: np.ndarray, results: np.ndarray) -> None:
+		best = int(np.argmax(results))
+		if self.best_result is None or results[best] > self.best_result:
+			self.best_params, self.best_result = params[best].tolist(), float(results[best])
+		self.history.append((self.evaluate.n_evaluations, self.best_result, self.best_params))
+		print(f"\t{self.name} {self.evaluate.n_evaluations} evals: {self.best_params} -> {self.best_result}")
+
+
+def sample_params(bounds: list[tuple[float, float]], n: int, rng: np.random.Generator, latin: bool = True) -> np.ndarray:
+	"""n params vectors inside bounds, latin hypercube: every dimension has one sample in each of its n strata"""
+	low = np.array([b[0] for b in bounds], dtype=np.float64)
+	high = np.array([b[1] for b in bounds], dtype=np.float64)
+	if latin:
+		u = (np.argsort(rng.random((len(bounds), n)), axis=1).T + rng.random((n, len(bounds)))) / n
+	else:
+		u = rng.random((n, len(bounds)))
+	return low + u * (high - low)
+
+
+def random_search(
+		evaluate: ParamsEvaluator,
+		bounds: list[tuple[float, float]],
+		budget: int,
+		rng: np.random.Generator,
+		latin: bool = True,
+		batch_size: int = 8192
+		) -> SearchTrajectory:
+	trajectory = SearchTrajectory("latin" if latin else "random", evaluate)
+	params = sample_params(bounds, budget, rng, latin=latin)
+	for i in range(0, budget, batch_size):
+		trajectory.update(params[i:i + batch_size], evaluate(params[i:i + batch_size]))
+	return trajectory
+
+
+def successive_halving(
+		evaluate: ParamsEvaluator,
+		bounds: list[tuple[float, float]],
+		budget: int,
+		rng: np.random.Generator,
+		eta: int = 3
+		) -> SearchTrajectory:
+	"""
+	evaluates many samples on a short part of the history, keeps the best 1/eta of them
+	and evaluates the survivors on a history eta times longer, until the whole scenario is used
+	"""
+	trajectory = SearchTrajectory("halving", evaluate)
+	rounds = max(1, math.ceil(math.log(max(budget, 2), eta) / 2))
+	# n + n / eta + n / eta^2 ... evaluations in total
+	n = max(1, int(budget / sum(eta ** -k for k in range(rounds))))
+	params = sample_params(bounds, n, rng)
+	for k in range(rounds):
+		fraction = eta ** (k - rounds + 1)
+		results = evaluate(params, fraction=fraction)
+		if k == rounds - 1:
+			trajectory.update(params, results)
+		else:
+			print(f"\thalving {evaluate.n_evaluations} evals: {len(params)} samples on {fraction:.3f} of the history")
+			params = params[np.argsort(results)[::-1][:max(1, len(params) // eta)]]
+	return trajectory
+
+
+def coordinate_search(
+		evaluate: ParamsEvaluator,
+		bounds: list[tuple[float, float]],
+		budget: int,
+		rng: np.random.Generator,
+		start_samples: int = None,
+		min_step: float = 1e-3
+		) -> SearchTrajectory:
+	"""
+	local refinement from the best of a latin hypercube sample: every step tries +- step on each coordinate
+	at once, moves to the best improvement or halves the steps when there is none
+	"""
+	trajectory = SearchTrajectory("coordinate", evaluate)
+	low = np.array([b[0] for b in bounds], dtype=np.float64)
+	high = np.array([b[1] for b in bounds], dtype=np.float64)
+	free = np.flatnonzero(high > low)
+
+	if start_samples is None:
+		start_samples = max(1, budget // 4)
+	params = sample_params(bounds, start_samples, rng)
+	trajectory.update(params, evaluate(params))
+	x = np.array(trajectory.best_params)
+	step = (high - low) / 4
+
+	while evaluate.n_evaluations + 2 * len(free) <= budget and len(free) > 0 and step[free].max() > min_step * (high - low)[free].max():
+		candidates = np.repeat(x[None, :], 2 * len(free), axis=0)
+		candidates[np.arange(len(free)), free] += step[free]
+		candidates[len(free) + np.arange(len(free)), free] -= step[free]
+		candidates = np.clip(candidates, low, high)
+
+		results = evaluate(candidates)
+		best = int(np.argmax(results))
+		if results[best] > trajectory.best_result:
+			x = candidates[best]
+		else:
+			step /= 2
+		trajectory.update(candidates, results)
+	return trajectory
+
+
+def grid_search(
+		evaluate: ParamsEvaluator,
+		bounds: list[tuple[float, float]],
+		budget: int,
+		rng: np.random.Generator,
+		iterations: list[int] = None,
+		batch_size: int = 8192
+		) -> SearchTrajectory:
+	"""the np.linspace grid of iterations, or without them an even grid of at most budget points over the free params"""
+	if iterations is None:
+		free = [b[1] > b[0] for b in bounds]
+		per_param = max(1, int(budget ** (1 / max(1, sum(free))) + 1e-9))
+		iterations = [per_param if f else 1 for f in free]
+	trajectory = SearchTrajectory("grid", evaluate)
+	for params in ParamsGrid(bounds, iterations).chunks(batch_size):
+		trajectory.update(params, evaluate(params))
+	return trajectory
+
+
+searches: dict[str, typing.Callable] = {
+	"grid": grid_search,
+	"random": lambda evaluate, bounds, budget, rng: random_search(evaluate, bounds, budget, rng, latin=False),
+	"latin": random_search,
+	"halving": successive_halving,
+	"coordinate": coordinate_search
+	}
+
+
+def best_searched_params(
+		alg_class: typing.ClassVar,
+		bounds: list[tuple[float, float]],
+		scenario: str,
+		search: str = "latin",
+		budget: int = 1000,
+		stocks_scenario: list[str] = None,
+		result_type: int = 0,
+		daily: bool = False,
+		seed: int = None
+		) -> tuple[tuple[list[float], float], SearchTrajectory]:
+	"""best params found by searches[search] with at most budget evaluations, and the trajectory of the search"""
+	print(f"searching {alg_class.__name__} on {scenario} with {search}, {budget} evaluations: ")
+	evaluate = ParamsEvaluator(alg_class, scenario, stocks_scenario=stocks_scenario, result_type=result_type, daily=daily)
+	trajectory = searches[search](evaluate, bounds, budget, np.random.default_rng(seed))
+	return ([round(float(a), 2) for a in trajectory.best_params], trajectory.best_result), trajectory
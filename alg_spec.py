@@ -0,0 +1,464 @@
+"""
+declarative strategies: a spec is made of expressions over indicators (rolling average, min, max, trend of the history
+of a stock), the price, the holding and the params, combined with arithmetic, comparisons and & | ~.
+compile_spec turns a spec into an AlgorithmStrategy subclass that runs on the tick loop and, with the same
+expressions evaluated on arrays of params rows, on BatchedAlgorithm: every spec can be swept with the batched path.
+
+	n, buy_perc, sell_perc, time_comp = Param("n_stock_mov", int), Param("buy_perc"), Param("sell_perc"), Param("time_comp", int)
+	MyAlg = compile_spec(
+		"MyAlg",
+		params=[n, buy_perc, sell_perc, time_comp],
+		buy=Eq(Holding(), 0) & (Price() + Cost() / n < Average(time_comp) * (1 + buy_perc)),
+		sell=(Holding() > 0) & (Price() > EntryPrice() * (1 + sell_perc)),
+		buy_size=n
+		)
+
+a tick buys buy_size when buy holds, otherwise sells sell_size when sell holds.
+the class has to be assigned to a module level name equal to its name, so the workers of a pool can unpickle it
+"""
+import operator
+import sys
+import typing
+
+import numpy as np
+
+from alg import AlgorithmStrategy, BatchedAlgorithm, transaction_cost
+from market import Market, Stock, rolling_average, rolling_extreme, rolling_trend
+
+# a compiled expression: (strategy, stock) -> value on the tick loop, (batch, stock_i) -> value or array on a batch
+TickFun = typing.Callable[[AlgorithmStrategy, Stock], typing.Any]
+BatchFun = typing.Callable[[BatchedAlgorithm, int], typing.Any]
+
+
+class Expr:
+	def tick(self, spec: "SpecCompiler") -> TickFun:
+		raise NotImplementedError()
+
+	def batched(self, spec: "SpecCompiler") -> BatchFun:
+		raise NotImplementedError()
+
+	def rows(self, spec: "SpecCompiler", batch: BatchedAlgorithm) -> np.ndarray:
+		"""value of every params row, for the expressions that don't depend on the stock"""
+		raise TypeError(f"{self!r} depends on the stock, it can't be a window")
+
+	def __add__(self, other):
+		return BinOp("+", self, other)
+
+	def __radd__(self, other):
+		return BinOp("+", other, self)
+
+	def __sub__(self, other):
+		return BinOp("-", self, other)
+
+	def __rsub__(self, other):
+		return BinOp("-", other, self)
+
+	def __mul__(self, other):
+		return BinOp("*", self, other)
+
+	def __rmul__(self, other):
+		return BinOp("*", other, self)
+
+	def __truediv__(self, other):
+		return BinOp("/", self, other)
+
+	def __rtruediv__(self, other):
+		return BinOp("/", other, self)
+
+	def __neg__(self):
+		return BinOp("-", Const(0), self)
+
+	def __lt__(self, other):
+		return Compare("<", self, other)
+
+	def __le__(self, other):
+		return Compare("<=", self, other)
+
+	def __gt__(self, other):
+		return Compare(">", self, other)
+
+	def __ge__(self, other):
+		return Compare(">=", self, other)
+
+	def __and__(self, other):
+		return And(self, other)
+
+	def __or__(self, other):
+		return Or(self, other)
+
+	def __invert__(self):
+		return Not(self)
+
+
+def expr(value: Expr | float) -> Expr:
+	return value if isinstance(value, Expr) else Const(value)
+
+
+class Const(Expr):
+	def __init__(self, value: float):
+		self.value = value
+
+	def tick(self, spec):
+		value = self.value
+		return lambda s, stock: value
+
+	def batched(self, spec):
+		value = self.value
+		return lambda b, i: value
+
+	def rows(self, spec, batch):
+		return np.full(batch.n_runs, self.value)
+
+	def __repr__(self):
+		return repr(self.value)
+
+
+class Param(Expr):
+	"""a params entry, int ones are truncated like the int() of read_params"""
+
+	def __init__(self, name: str, kind: type = float, default: float = None):
+		self.name = name
+		self.kind = kind
+		self.default = default
+
+	def tick(self, spec):
+		i = spec.param_index(self)
+		return lambda s, stock: s.param_values[i]
+
+	def batched(self, spec):
+		i = spec.param_index(self)
+		return lambda b, stock_i: b.param_values[i]
+
+	def rows(self, spec, batch):
+		return batch.param_values[spec.param_index(self)]
+
+	def __repr__(self):
+		return f"Param({self.name!r}, {self.kind.__name__})"
+
+
+class Price(Expr):
+	def tick(self, spec):
+		return lambda s, stock: stock.price()
+
+	def batched(self, spec):
+		return lambda b, i: b.price(i)
+
+	def __repr__(self):
+		return "Price()"
+
+
+class Cost(Expr):
+	"""transaction cost of a trade at the current price"""
+
+	def tick(self, spec):
+		return lambda s, stock: transaction_cost(stock.price())
+
+	def batched(self, spec):
+		return lambda b, i: transaction_cost(b.price(i))
+
+	def __repr__(self):
+		return "Cost()"
+
+
+class Holding(Expr):
+	"""stocks in the portfolio"""
+
+	def tick(self, spec):
+		return lambda s, stock: s.portfolio[stock.name]
+
+	def batched(self, spec):
+		return lambda b, i: b.portfolio[:, i]
+
+	def __repr__(self):
+		return "Holding()"
+
+
+class EntryPrice(Expr):
+	"""average price of the buys since the last sell, 0 when there are none"""
+
+	def tick(self, spec):
+		spec.entry_prices = True
+		return lambda s, stock: s.entry_price(stock.name)
+
+	def batched(self, spec):
+		spec.entry_prices = True
+
+		def entry_price(b, i):
+			n_buyed = b.n_buyed[:, i]
+			return np.where(n_buyed > 0, b.tot_buyed[:, i] / np.maximum(n_buyed, 1), 0.0)
+		return entry_price
+
+	def __repr__(self):
+		return "EntryPrice()"
+
+
+class Indicator(Expr):
+	"""
+	a statistic of the history of the stock over a window, from_time and to_time like BenchmarkStock (relative to
+	the current tick when <= 0). the windows can depend on the params: on a batch the indicator is computed once
+	for every distinct window of the rows
+	"""
+	method: str = ""
+
+	def __init__(self, from_time: Expr | int, to_time: Expr | int = -1):
+		self.from_time = expr(from_time)
+		self.to_time = expr(to_time)
+
+	def series(self, past: np.ndarray, ends: np.ndarray, from_time: int, to_time: int) -> np.ndarray:
+		raise NotImplementedError()
+
+	def tick(self, spec):
+		method, from_time, to_time = self.method, self.from_time.tick(spec), self.to_time.tick(spec)
+		return lambda s, stock: getattr(stock, method)(from_time=int(from_time(s, stock)), to_time=int(to_time(s, stock)))
+
+	def batched(self, spec):
+		table = spec.add_table(self)
+		return lambda b, i: b.tables[table][b.table_rows[table], i, b.tick_i]
+
+	def table(self, spec: "SpecCompiler", batch: BatchedAlgorithm) -> tuple[np.ndarray, np.ndarray]:
+		"""(n_windows, n_stocks, n_ticks) values of the distinct windows of the rows, and the window of every row"""
+		windows = np.stack((self.from_time.rows(spec, batch), self.to_time.rows(spec, batch)), axis=1).astype(np.int64)
+		distinct, rows = np.unique(windows, axis=0, return_inverse=True)
+		values = np.array([[self.series(past, batch.ends, int(f), int(t)) for past in batch.prices] for f, t in distinct])
+		return values, rows.reshape(-1)
+
+	def __repr__(self):
+		return f"{type(self).__name__}({self.from_time!r}, {self.to_time!r})"
+
+
+class Average(Indicator):
+	method = "historical_average"
+
+	def series(self, past, ends, from_time, to_time):
+		return rolling_average(past, ends, from_time=from_time, to_time=to_time)
+
+
+class Min(Indicator):
+	method = "historical_min"
+
+	def series(self, past, ends, from_time, to_time):
+		return rolling_extreme(past, ends, from_time=from_time, to_time=to_time)
+
+
+class Max(Indicator):
+	method = "historical_max"
+
+	def series(self, past, ends, from_time, to_time):
+		return rolling_extreme(past, ends, from_time=from_time, to_time=to_time, maximum=True)
+
+
+class Trend(Indicator):
+	method = "trend"
+
+	def __init__(self, from_time: Expr | int = -2, to_time: Expr | int = -1):
+		super().__init__(from_time, to_time)
+
+	def series(self, past, ends, from_time, to_time):
+		return rolling_trend(past, ends, from_time=from_time, to_time=to_time)
+
+
+class BinOp(Expr):
+	ops = {"+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv}
+
+	def __init__(self, op: str, left: Expr | float, right: Expr | float):
+		self.op = op
+		self.left = expr(left)
+		self.right = expr(right)
+
+	def tick(self, spec):
+		op, left, right = self.ops[self.op], self.left.tick(spec), self.right.tick(spec)
+		return lambda s, stock: op(left(s, stock), right(s, stock))
+
+	def batched(self, spec):
+		op, left, right = self.ops[self.op], self.left.batched(spec), self.right.batched(spec)
+		return lambda b, i: op(left(b, i), right(b, i))
+
+	def rows(self, spec, batch):
+		return self.ops[self.op](self.left.rows(spec, batch), self.right.rows(spec, batch))
+
+	def __repr__(self):
+		return f"({self.left!r} {self.op} {self.right!r})"
+
+
+class Compare(BinOp):
+	ops = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge, "==": operator.eq, "!=": operator.ne}
+
+
+def Eq(left: Expr | float, right: Expr | float) -> Compare:
+	return Compare("==", left, right)
+
+
+class And(Expr):
+	def __init__(self, left: Expr, right: Expr):
+		self.left = expr(left)
+		self.right = expr(right)
+
+	def tick(self, spec):
+		# short circuit like the hand written strategies: the right side may divide by a zero holding
+		left, right = self.left.tick(spec), self.right.tick(spec)
+		return lambda s, stock: left(s, stock) and right(s, stock)
+
+	def batched(self, spec):
+		left, right = self.left.batched(spec), self.right.batched(spec)
+		return lambda b, i: np.logical_and(left(b, i), right(b, i))
+
+	def __repr__(self):
+		return f"({self.left!r} & {self.right!r})"
+
+
+class Or(And):
+	def tick(self, spec):
+		left, right = self.left.tick(spec), self.right.tick(spec)
+		return lambda s, stock: left(s, stock) or right(s, stock)
+
+	def batched(self, spec):
+		left, right = self.left.batched(spec), self.right.batched(spec)
+		return lambda b, i: np.logical_or(left(b, i), right(b, i))
+
+	def __repr__(self):
+		return f"({self.left!r} | {self.right!r})"
+
+
+class Not(Expr):
+	def __init__(self, operand: Expr):
+		self.operand = expr(operand)
+
+	def tick(self, spec):
+		operand = self.operand.tick(spec)
+		return lambda s, stock: not operand(s, stock)
+
+	def batched(self, spec):
+		operand = self.operand.batched(spec)
+		return lambda b, i: np.logical_not(operand(b, i))
+
+	def __repr__(self):
+		return f"~{self.operand!r}"
+
+
+class SpecCompiler:
+	"""the params of a spec, and what its expressions need: the indicator tables of a batch, the entry prices"""
+
+	def __init__(self, params: list[Param]):
+		self.params = params
+		self.tables: list[Indicator] = []
+		self.entry_prices = False
+
+	def param_index(self, param: Param) -> int:
+		for i, p in enumerate(self.params):
+			if p is param or p.name == param.name:
+				return i
+		raise KeyError(f"param {param.name} is not in the params of the spec")
+
+	def add_table(self, indicator: Indicator) -> int:
+		# the same indicator used twice shares its table
+		for i, t in enumerate(self.tables):
+			if repr(t) == repr(indicator):
+				return i
+		self.tables.append(indicator)
+		return len(self.tables) - 1
+
+
+def compile_spec(
+		name: str,
+		params: list[Param],
+		buy: Expr,
+		sell: Expr,
+		buy_size: Expr | int = 1,
+		sell_size: Expr | int = None
+		) -> type:
+	"""the AlgorithmStrategy subclass of the spec, with buy_sell for the tick loop and batched_buy_sell for BatchedAlgorithm"""
+	buy_size = expr(buy_size)
+	sell_size = Holding() if sell_size is None else expr(sell_size)
+	spec = SpecCompiler(params)
+	tick_buy, tick_sell, tick_buy_size, tick_sell_size = (e.tick(spec) for e in (buy, sell, buy_size, sell_size))
+	batch_buy, batch_sell, batch_buy_size, batch_sell_size = (e.batched(spec) for e in (buy, sell, buy_size, sell_size))
+	entry_prices = spec.entry_prices
+
+	class SpecAlgorithm(AlgorithmStrategy):
+		def __init__(self, market: Market, start_capital: float = 10000, params: list = None):
+			super().__init__(market, name, start_capital)
+			self.param_values = self.read_params(params if params is not None else [])
+			self.buyed: dict[str, list] = {stock.name: [0, 0.0] for stock in self.market.stocks}
+
+		@staticmethod
+		def read_params(values: list) -> tuple:
+			if len(values) != len(params):
+				if any(p.default is None for p in params):
+					raise ValueError(f"{name} takes {len(params)} params, {[p.name for p in params]}")
+				values = [p.default for p in params]
+			return tuple(p.kind(v) for p, v in zip(params, values))
+
+		def entry_price(self, stock_name: str) -> float:
+			n_buyed, tot_buyed = self.buyed[stock_name]
+			return tot_buyed / n_buyed if n_buyed > 0 else 0
+
+		def buy_sell(self, stock: Stock) -> tuple[int, int]:
+			if tick_buy(self, stock):
+				if entry_prices:
+					self.buyed[stock.name][0] += 1
+					self.buyed[stock.name][1] += stock.price()
+				return int(tick_buy_size(self, stock)), 0
+			if tick_sell(self, stock):
+				to_sell = int(tick_sell_size(self, stock))
+				if entry_prices:
+					self.buyed[stock.name] = [0, 0.0]
+				return 0, to_sell
+			return 0, 0
+
+		@classmethod
+		def batched_params(cls, batch: BatchedAlgorithm, rows: np.ndarray) -> None:
+			read = [cls.read_params(list(p)) for p in rows]
+			batch.n_runs = len(read)
+			batch.param_values = [
+				np.array([r[i] for r in read], dtype=np.int64 if p.kind is int else np.float64) for i, p in enumerate(params)
+				]
+			batch.tables, batch.table_rows = [], []
+			for indicator in spec.tables:
+				values, table_rows = indicator.table(spec, batch)
+				batch.tables.append(values)
+				batch.table_rows.append(table_rows)
+
+		@classmethod
+		def batched_setup(cls, batch: BatchedAlgorithm) -> None:
+			batch.n_buyed = np.zeros(batch.portfolio.shape, dtype=np.int64)
+			batch.tot_buyed = np.zeros(batch.portfolio.shape, dtype=np.float64)
+
+		@classmethod
+		def batched_buy_sell(cls, batch: BatchedAlgorithm, stock_i: int) -> tuple[np.ndarray, np.ndarray]:
+			n_runs = len(batch.capital)
+			with np.errstate(divide='ignore', invalid='ignore'):
+				to_buy = np.broadcast_to(batch_buy(batch, stock_i), n_runs)
+				to_sell = ~to_buy & np.broadcast_to(batch_sell(batch, stock_i), n_runs)
+				buy_size = np.broadcast_to(batch_buy_size(batch, stock_i), n_runs)
+				sell_size = np.broadcast_to(batch_sell_size(batch, stock_i), n_runs)
+			if entry_prices:
+				price = batch.price(stock_i)
+				batch.n_buyed[:, stock_i] = np.where(to_sell, 0, batch.n_buyed[:, stock_i] + to_buy)
+				batch.tot_buyed[:, stock_i] = np.where(to_sell, 0.0, batch.tot_buyed[:, stock_i] + np.where(to_buy, price, 0.0))
+			return np.where(to_buy, buy_size, 0).astype(np.int64), np.where(to_sell, sell_size, 0).astype(np.int64)
+
+	SpecAlgorithm.spec = f"{name}(params={params!r}, buy={buy!r}, sell={sell!r}, buy_size={buy_size!r}, sell_size={sell_size!r})"
+	SpecAlgorithm.__name__ = SpecAlgorithm.__qualname__ = name
+	# pickled by reference, like the classes written by hand
+	SpecAlgorithm.__module__ = sys._getframe(1).f_globals.get('__name__', __name__)
+	return SpecAlgorithm
+
+
+n_stock_mov, buy_perc, sell_perc, time_comp = Param("n_stock_mov", int), Param("buy_perc"), Param("sell_perc"), Param("time_comp", int)
+
+# alg.AllInAllOut and alg.OneInAllOut as specs
+AllInAllOutSpec = compile_spec(
+	"AllInAllOutSpec",
+	params=[n_stock_mov, buy_perc, sell_perc, time_comp],
+	buy=Eq(Holding(), 0) & (Price() + Cost() / n_stock_mov < Average(time_comp) * (1 + buy_perc)),
+	sell=(Holding() > 0) & (Price() - Cost() / n_stock_mov > Average(time_comp) * (1 + sell_perc)),
+	buy_size=n_stock_mov
+	)
+
+OneInAllOutSpec = compile_spec(
+	"OneInAllOutSpec",
+	params=[n_stock_mov, buy_perc, sell_perc, time_comp],
+	buy=Price() + Cost() / n_stock_mov <= Average(time_comp) * (1 + buy_perc),
+	sell=(Holding() > 0) & (Price() - Cost() / Holding() >= EntryPrice() * (1 + sell_perc)),
+	buy_size=n_stock_mov
+	)
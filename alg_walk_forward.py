@@ -0,0 +1,134 @@
+"""
+walk-forward validation: the history is cut in rolling train/test windows, the params fitted on a train window are
+evaluated on the test window right after it, so every reported result is out of sample.
+the scenario is loaded once and shared with the workers, the windows are views of the shared prices
+"""
+import functools
+import typing
+
+import numpy as np
+
+from alg_benchmark import MarketBenchmark
+from alg_best_fitter import SweepExecutor, implements
+from alg_search import ParamsEvaluator, grid_search, searches
+
+
+def walk_forward_folds(n_ticks: int, train_len: int, test_len: int, step: int = None, start: int = 20) -> list[tuple[int, int, int]]:
+	"""(train from, test from, test to) of every fold, consecutive folds are step ticks apart (test_len by default)"""
+	if step is None:
+		step = test_len
+	if train_len <= start + 1 or test_len < 2 or step < 1:
+		raise ValueError(f"train {train_len}, test {test_len} and step {step} ticks with start {start}")
+
+	folds = []
+	for train_from in range(0, n_ticks - train_len - test_len + 1, step):
+		folds.append((train_from, train_from + train_len, train_from + train_len + test_len))
+	if len(folds) == 0:
+		raise ValueError(f"{n_ticks} ticks are not enough for a fold of {train_len} + {test_len} ticks")
+	return folds
+
+
+def window(scenario: str, begin: int, end: int) -> str:
+	"""registers the ticks begin:end of a shared scenario as a shared scenario of its own, a view of the same prices"""
+	name = f"{scenario}[{begin}:{end}]"
+	if name not in MarketBenchmark.shared_scenarios:
+		names, prices = MarketBenchmark.shared_scenarios[scenario]
+		MarketBenchmark.share(name, names, prices[:, begin:end])
+	return name
+
+
+def walk_forward_fold(
+		alg_class: typing.ClassVar,
+		scenario: str,
+		stocks_scenario: list[str],
+		bounds: list[tuple[float, float]],
+		search: str,
+		budget: int,
+		iterations: list[int],
+		result_type: int,
+		start: int,
+		seed: int,
+		fold: tuple[int, int, int]
+		) -> dict[str, typing.Any]:
+	"""fits the train window of the fold and returns the stats of the fitted params on its test window"""
+	train_from, test_from, test_to = fold
+	train = window(scenario, train_from, test_from)
+	# the test window begins start ticks early: the history the strategy looks back at before its first trade
+	test = window(scenario, test_from - start, test_to)
+
+	evaluate = ParamsEvaluator(alg_class, train, stocks_scenario=stocks_scenario, result_type=result_type, start=start)
+	rng = np.random.default_rng(None if seed is None else [seed, train_from])
+	if search == "grid":
+		trajectory = grid_search(evaluate, bounds, budget, rng, iterations=iterations)
+	else:
+		trajectory = searches[search](evaluate, bounds, budget, rng)
+	params = [round(float(a), 2) for a in trajectory.best_params]
+
+	if implements(alg_class, "vectorized_moves"):
+		fun = MarketBenchmark.vectorized_stats_of_benchmark
+	else:
+		fun = MarketBenchmark.stats_of_benchmark
+	stats = fun(self=evaluate.benchmark, alg_class=alg_class, scenario=test, stocks_scenario=stocks_scenario, params=params, start=start)
+	stats.pop('moves')
+	return {'fold': fold, 'params': params, 'train result': trajectory.best_result, 'test stats': stats}
+
+
+def aggregate_folds(results: list[dict[str, typing.Any]]) -> dict[str, typing.Any]:
+	"""out of sample stats of all the folds, every test window starts from 0 capital"""
+	tot = np.array([r['test stats']['tot capital'] for r in results], dtype=np.float64)
+	return {
+		'folds': len(results),
+		'tot capital': round(float(tot.sum()), 2),
+		'mean tot capital': round(float(tot.mean()), 2),
+		'std tot capital': round(float(tot.std()), 2),
+		'worst fold': float(tot.min()),
+		'best fold': float(tot.max()),
+		'profitable folds': int((tot > 0).sum()),
+		'n transactions': sum(r['test stats']['n transactions'] for r in results),
+		'min capital': min(r['test stats']['min capital'] for r in results)
+		}
+
+
+def walk_forward(
+		alg_class: typing.ClassVar,
+		bounds: list[tuple[float, float]],
+		scenario: str = "all_time",
+		train_len: int = 1000,
+		test_len: int = 250,
+		step: int = None,
+		stocks_scenario: list[str] = None,
+		search: str = "latin",
+		budget: int = 1000,
+		iterations: list[int] = None,
+		result_type: int = 0,
+		start: int = 20,
+		seed: int = None,
+		processes: int = None,
+		print_stats: bool = True
+		) -> tuple[list[dict[str, typing.Any]], dict[str, typing.Any]]:
+	"""
+	results of every fold, in order, and their aggregate. search is one of alg_search.searches, "grid" with
+	iterations for the full np.linspace grid. the folds run concurrently, one per worker
+	"""
+	with SweepExecutor(processes=processes) as executor:
+		executor.share_scenario(scenario, stocks_scenario)
+		folds = walk_forward_folds(executor.shared_info[scenario][1][1], train_len, test_len, step, start)
+		print(f"walk-forward {alg_class.__name__} on {scenario}: {len(folds)} folds of {train_len} + {test_len} ticks, {search} search")
+
+		task = functools.partial(
+			walk_forward_fold, alg_class, scenario, stocks_scenario, bounds, search, budget, iterations, result_type, start, seed
+			)
+		results = sorted(executor.imap(task, folds), key=lambda r: r['fold'])
+
+	summary = aggregate_folds(results)
+	if print_stats:
+		print(f"-----{alg_class.__name__} walk-forward-----")
+		for r in results:
+			train_from, test_from, test_to = r['fold']
+			print(
+				f"\t{train_from}:{test_from} -> {test_from}:{test_to}\t{r['params']} -> {r['train result']}"
+				f"\tout of sample: {r['test stats']['tot capital']}, {r['test stats']['n transactions']} transactions"
+				)
+		for k, v in summary.items():
+			print(f"{k}: {v}")
+	return results, summary
@@ -1,48 +1,119 @@
+import asyncio
+import concurrent.futures
+import functools
+import multiprocessing as mp
 import os
 from datetime import datetime
 
+import numpy as np
 import requests as requests
 
-
-def clean():
-	dir_to_clean = "./scenarios/to_clean"
-	dir_clean = "./scenarios/current"
-
-	csv_char = ","
-
-	for file in os.listdir(dir_to_clean):
-		print(f"cleaning {file}")
-		with open(f"{dir_to_clean}/{file}", "r") as f:
-			past = [line.rstrip().split(csv_char)[1].replace("$", '') + "\n" for line in f.readlines()[1:]]
-		past.reverse()
-		with open(f"{dir_clean}/{file[:-4]}", "w+") as f:
-			f.writelines(past)
-		print(f"\tcleaned {file}")
+import scenario_file
+
+
+def parse_lines(lines: list[str], sep: str, decimal: str) -> tuple[list[str], list[str]]:
+	dates, prices = [], []
+	for line in lines:
+		fields = line.split(sep)
+		if len(fields) < 2:
+			continue
+		dates.append(fields[0].strip().strip('"'))
+		prices.append(fields[1].strip().strip('"').replace("$", "").replace(decimal, "."))
+	return dates, prices
+
+
+def parse_dates(dates: list[str]) -> np.ndarray:
+	"""int64 epoch seconds of iso dates, and of the mm/dd/yyyy dates of the nasdaq exports"""
+	iso = [datetime.strptime(d, "%m/%d/%Y").strftime("%Y-%m-%d") if "/" in d else d for d in dates]
+	return np.array(iso, dtype="datetime64[s]").astype(np.int64)
+
+
+def parse_prices(path: str, chunk_size: int = 1 << 20) -> tuple[np.ndarray, np.ndarray]:
+	"""
+	int64 epoch seconds and float64 prices of a "date"<sep>price csv with a header line, oldest first.
+	"date";1,5 files (decimal commas) and date,$1.5 files (nasdaq exports, mm/dd/yyyy dates) are both read,
+	chunk_size bytes at a time
+	"""
+	timestamps, prices = [], []
+	with open(path, "r", encoding="utf-8-sig") as f:
+		header = f.readline()
+		sep, decimal = (";", ",") if ";" in header else (",", ".")
+		rest = ""
+		while True:
+			chunk = f.read(chunk_size)
+			lines = (rest + chunk).split("\n")
+			# the last line of a chunk may continue in the next one
+			rest = lines.pop() if len(chunk) > 0 else ""
+			dates, values = parse_lines(lines, sep, decimal)
+			timestamps.append(parse_dates(dates))
+			prices.append(np.array(values, dtype=np.float64))
+			if len(chunk) == 0:
+				break
+
+	timestamps, prices = np.concatenate(timestamps), np.concatenate(prices)
+	order = np.argsort(timestamps, kind="stable")
+	return timestamps[order], prices[order]
+
+
+def align(series: list[tuple[np.ndarray, np.ndarray]]) -> tuple[np.ndarray, np.ndarray]:
+	"""timestamps common to every series and the (n_series, n_timestamps) prices at them"""
+	common = functools.reduce(np.intersect1d, [timestamps for timestamps, _ in series])
+	return common, np.array([prices[np.searchsorted(timestamps, common)] for timestamps, prices in series])
+
+
+def clean(
+		dir_to_clean: str = "./scenarios/to_clean",
+		scenario: str = "all_time",
+		text_dir: str = None,
+		processes: int = None
+		) -> str:
+	"""
+	parses every csv of dir_to_clean on a process pool and writes the binary scenario of the dates they all have,
+	with their timestamps. with text_dir every stock is also written as text, one price per line at the common dates
+	only, so the text stocks have the same length and are read back as a scenario
+	"""
+	files = sorted(file for file in os.listdir(dir_to_clean) if file.endswith(".csv"))
+	names = [file[:-4] for file in files]
+	print(f"cleaning {', '.join(files)}")
+	with mp.Pool(min(len(files), processes if processes is not None else mp.cpu_count())) as pool:
+		series = pool.map(parse_prices, [f"{dir_to_clean}/{file}" for file in files])
+
+	timestamps, prices = align(series)
+	if text_dir is not None:
+		os.makedirs(text_dir, exist_ok=True)
+		for name, row in zip(names, prices):
+			with open(f"{text_dir}/{name}", "w+") as f:
+				f.writelines(f"{v!r}\n" for v in row.tolist())
+
+	path = scenario_file.scenario_path(scenario)
+	scenario_file.write_scenario(path, names, prices, timestamps)
+	print(f"\tcleaned {len(files)} stocks, {len(timestamps)} common dates in {path}")
+	return path
 
 # time_samples: np.ndarray = np.arange(4 * 60, 16 * 60, 10)
 
-
-def scrape(dir_to_save: str, quote: str, sample_every_minute: int = 5):
-	headers = {
-		'accept': 'application/json, text/plain, */*',
-		'accept-encoding': 'gzip, deflate, br, zstd',
-		'accept-language': 'it-IT,it;q=0.9,en-US;q=0.8,en;q=0.7',
-		'origin': 'https//www.nasdaq.com',
-		'priority': 'u=1, i',
-		'referer': 'https://www.nasdaq.com/',
-		'sec-ch-ua': '"Not)A;Brand";v="99", "Opera GX";v="113", "Chromium";v="127"',
-		'sec-ch-ua-mobile': '?0',
-		'sec-ch-ua-platform': '\"Windows\"',
-		'sec-fetch-dest': 'empty',
-		'sec-fetch-mode': 'cors',
-		'sec-fetch-site': 'same-site',
-		'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36 OPR/113.0.0.0'
-		}
-
-	resp = requests.get(f"https://api.nasdaq.com/api/quote/{quote.upper()}/chart?assetclass=stocks", headers=headers)
-	chart = resp.json()['data']['chart']
-
-	t_samples: list = []
+CHART_URL = "https://api.nasdaq.com/api/quote/{quote}/chart?assetclass=stocks"
+
+HEADERS = {
+	'accept': 'application/json, text/plain, */*',
+	'accept-encoding': 'gzip, deflate, br, zstd',
+	'accept-language': 'it-IT,it;q=0.9,en-US;q=0.8,en;q=0.7',
+	'origin': 'https//www.nasdaq.com',
+	'priority': 'u=1, i',
+	'referer': 'https://www.nasdaq.com/',
+	'sec-ch-ua': '"Not)A;Brand";v="99", "Opera GX";v="113", "Chromium";v="127"',
+	'sec-ch-ua-mobile': '?0',
+	'sec-ch-ua-platform': '\"Windows\"',
+	'sec-fetch-dest': 'empty',
+	'sec-fetch-mode': 'cors',
+	'sec-fetch-site': 'same-site',
+	'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36 OPR/113.0.0.0'
+	}
+
+
+def sample_chart(chart: list[dict], sample_every_minute: int) -> list:
+	"""the first value of every sample_every_minute bucket of the day"""
+	t_samples: set[int] = set()
 	y: list = []
 	for d in chart:
 		dateTime = d['z']['dateTime'].split(" ")
@@ -55,24 +126,91 @@ def scrape(dir_to_save: str, quote: str, sample_every_minute: int = 5):
 		time_sample -= time_sample % sample_every_minute
 
 		if time_sample not in t_samples:
-			t_samples.append(time_sample)
+			t_samples.add(time_sample)
 			y.append(d['z']['value'])
-
-	# dir_to_save = "./scenarios/daily/2024-10-18/"
-
-	if not os.path.exists(dir_to_save):
-		os.makedirs(dir_to_save)
-
-	with open(f"{dir_to_save}/{quote}", "w+") as file:
-		file.writelines([f"{v}\n" for v in y])
-	with open(f"{dir_to_save}_norm/{quote}", "w+") as file:
-		file.writelines([f"{round(float(v) - float(y[0]), 4)}\n" for v in y])
-
-	print(f"wrote {len(y)} values")
+	return y
+
+
+def write_lines_atomic(path: str, lines: list[str]) -> None:
+	"""written aside and renamed, a reader never sees a half written file"""
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	tmp_path = f"{path}.tmp{os.getpid()}"
+	with open(tmp_path, "w+") as file:
+		file.writelines(lines)
+	os.replace(tmp_path, path)
+
+
+def save_quote(dir_to_save: str, quote: str, y: list) -> None:
+	write_lines_atomic(f"{dir_to_save}/{quote}", [f"{v}\n" for v in y])
+	write_lines_atomic(f"{dir_to_save}_norm/{quote}", [f"{round(float(v) - float(y[0]), 4)}\n" for v in y])
+
+
+async def fetch_chart(
+		session: requests.Session,
+		semaphore: asyncio.Semaphore,
+		url: str,
+		quote: str,
+		retries: int,
+		backoff: float,
+		timeout: float
+		) -> list[dict]:
+	"""the chart of quote, retried with exponential backoff on connection errors, 429 and 5xx"""
+	for attempt in range(retries + 1):
+		async with semaphore:
+			try:
+				resp = await asyncio.to_thread(session.get, url.format(quote=quote.upper()), headers=HEADERS, timeout=timeout)
+				if resp.status_code != 429 and resp.status_code < 500:
+					resp.raise_for_status()
+					return resp.json()['data']['chart']
+				error = requests.HTTPError(f"{resp.status_code} for {quote}", response=resp)
+			except (requests.ConnectionError, requests.Timeout) as e:
+				error = e
+		if attempt == retries:
+			raise error
+		await asyncio.sleep(backoff * 2 ** attempt)
+
+
+async def scrape_all(
+		dir_to_save: str,
+		quotes: list[str],
+		sample_every_minute: int = 5,
+		url: str = CHART_URL,
+		max_concurrency: int = 8,
+		retries: int = 3,
+		backoff: float = 0.5,
+		timeout: float = 10
+		) -> dict[str, int | Exception]:
+	"""
+	scrapes the quotes concurrently, at most max_concurrency requests at a time over one pool of connections.
+	url has a {quote} field. returns the number of values written for each quote, or the error that stopped it
+	"""
+	semaphore = asyncio.Semaphore(max_concurrency)
+	# the blocking requests run on their own threads, as many as the requests in flight
+	asyncio.get_running_loop().set_default_executor(concurrent.futures.ThreadPoolExecutor(max_concurrency + 1))
+	with requests.Session() as session:
+		adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+		session.mount("http://", adapter)
+		session.mount("https://", adapter)
+
+		async def scrape_quote(quote: str) -> int:
+			y = sample_chart(await fetch_chart(session, semaphore, url, quote, retries, backoff, timeout), sample_every_minute)
+			await asyncio.to_thread(save_quote, dir_to_save, quote, y)
+			return len(y)
+
+		results = await asyncio.gather(*(scrape_quote(q) for q in quotes), return_exceptions=True)
+
+	for quote, result in zip(quotes, results):
+		print(f"\t{quote}: " + (f"wrote {result} values" if isinstance(result, int) else f"failed, {result!r}"))
+	return dict(zip(quotes, results))
+
+
+def scrape(dir_to_save: str, quote: str, sample_every_minute: int = 5, url: str = CHART_URL):
+	result = asyncio.run(scrape_all(dir_to_save, [quote], sample_every_minute=sample_every_minute, url=url))[quote]
+	if isinstance(result, Exception):
+		raise result
 
 
 if __name__ == '__main__':
 	# clean()
 	t = datetime.now().strftime("%Y-%m-%d")
-	for q in ["msft", "nflx", "tsla", "aapl", "nvda", "amzn"]:
-		scrape(f"./scenarios/daily/{t}", quote=q)
+	asyncio.run(scrape_all(f"./scenarios/daily/{t}", ["msft", "nflx", "tsla", "aapl", "nvda", "amzn"]))
@@ -0,0 +1,87 @@
+"""
+the vectorized and the batched engines against the tick loop: every strategy runs on the shipped scenarios with a
+small grid of params on every path it implements, and the stats have to be equal to the ones of the loop, bit for bit.
+
+	python equivalence_check.py
+	python equivalence_check.py --scenarios current all_time --grid 3
+"""
+import argparse
+import itertools
+import sys
+import typing
+
+import numpy as np
+
+import alg
+import alg_spec
+from alg_benchmark import MarketBenchmark
+from alg_best_fitter import implements
+
+strategies: list[typing.ClassVar] = [alg.AllInAllOut, alg.OneInAllOut, alg_spec.AllInAllOutSpec, alg_spec.OneInAllOutSpec]
+
+# scenario -> settle scenario, None when the trades are settled at the prices of the scenario
+scenarios: dict[str, str | None] = {
+	"current": None,
+	"all_time": None,
+	"worst_scenario": None,
+	"worst_worst_scenario": None,
+	"daily/2024-10-18_norm": "daily/2024-10-18"
+	}
+
+compared = ['n transactions', 'max capital', 'min capital', 'liquid', 'tot stock value', 'tot capital']
+
+
+def params_grid(n: int) -> np.ndarray:
+	"""n values of buy_perc, sell_perc and time_comp, for 1 and 3 stocks per move"""
+	axes = [[1, 3], np.linspace(-1, 1, n), np.linspace(-0.5, 0.5, n), np.linspace(-15, -2, n).round()]
+	return np.array(list(itertools.product(*axes)), dtype=np.float64)
+
+
+def check(alg_class: typing.ClassVar, scenario: str, settle_scenario: str | None, params: np.ndarray) -> list[str]:
+	"""the mismatches of the vectorized and batched stats of every row of params with the ones of the loop"""
+	benchmark = MarketBenchmark()
+	kwargs = {'scenario': scenario, 'settle_scenario': settle_scenario}
+	batched = None
+	if implements(alg_class, "batched_buy_sell"):
+		batched = benchmark.batched_stats_of_benchmark(alg_class=alg_class, params=params, **kwargs)
+
+	mismatches = []
+	for i, p in enumerate(params.tolist()):
+		loop = benchmark.stats_of_benchmark(alg_class=alg_class, params=p, **kwargs)
+		if implements(alg_class, "vectorized_moves"):
+			vectorized = benchmark.vectorized_stats_of_benchmark(alg_class=alg_class, params=p, **kwargs)
+			for k in compared + ['final portfolio']:
+				if vectorized[k] != loop[k]:
+					mismatches.append(f"vectorized {alg_class.__name__} {scenario} {p} {k}: {vectorized[k]} != {loop[k]}")
+		if batched is not None:
+			for k in compared:
+				if batched[k][i] != loop[k]:
+					mismatches.append(f"batched {alg_class.__name__} {scenario} {p} {k}: {batched[k][i]} != {loop[k]}")
+			if batched['final portfolio'][i].tolist() != list(loop['final portfolio'].values()):
+				mismatches.append(f"batched {alg_class.__name__} {scenario} {p} final portfolio")
+	return mismatches
+
+
+def run_checks(scenario_names: list[str], n: int) -> list[str]:
+	params = params_grid(n)
+	mismatches = []
+	for scenario in scenario_names:
+		for alg_class in strategies:
+			found = check(alg_class, scenario, scenarios.get(scenario), params)
+			print(f"{alg_class.__name__:<20}{scenario:<28}{len(params)} params, {len(found)} mismatches")
+			mismatches += found
+	return mismatches
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="vectorized and batched engines against the tick loop")
+	parser.add_argument("--scenarios", nargs="+", default=list(scenarios))
+	parser.add_argument("--grid", type=int, default=2, help="values per param, the grid has 2 * grid^3 params")
+	args = parser.parse_args()
+
+	# the engines are compared, not the cache
+	MarketBenchmark.result_cache = None
+	found = run_checks(args.scenarios, args.grid)
+	for mismatch in found:
+		print(mismatch)
+	sys.exit(1 if len(found) > 0 else 0)
@@ -0,0 +1,158 @@
+"""
+live mode: prices (or ohlc bars) are pushed into a running LiveMarket as they arrive, and the registered strategies
+tick once for every complete tick, a new value for each stock. the pasts only grow, so the rolling stats of the stocks
+extend by the new values and a tick costs the same however long the history is.
+a source is any iterable of (name, price) or (name, (open, high, low, close)) events: a tailed file, a socket, a queue
+"""
+import queue
+import socket
+import threading
+import time
+import typing
+
+from alg import AlgorithmStrategy
+from market import Market, Stock
+
+
+class LiveStock(Stock):
+	def __init__(self, name: str, past: list = None):
+		super().__init__(name, list(past) if past is not None else [])
+		# (open, high, low, close) of every tick pushed as a bar, None for the plain prices
+		self.bars: list[tuple[float, float, float, float] | None] = [None] * len(self.past)
+
+	def append(self, value: float | tuple[float, float, float, float]) -> None:
+		"""a price, or a bar of which the close is the price"""
+		if isinstance(value, tuple):
+			self.bars.append(value)
+			self.past.append(float(value[3]))
+		else:
+			self.bars.append(None)
+			self.past.append(float(value))
+
+
+class LiveMarket(Market):
+	"""
+	the stocks are fixed when the market is created, as the strategies keep one holding per stock.
+	history seeds the pasts, every stock needs the same number of values
+	"""
+
+	def __init__(self, names: list[str], history: dict[str, list] = None):
+		super().__init__()
+		if history is None:
+			history = {}
+		self.stocks = [LiveStock(name, history.get(name)) for name in names]
+		if len({len(stock.past) for stock in self.stocks}) > 1:
+			raise ValueError("the histories of the stocks have different lengths")
+
+		self.pending: dict[int, float | tuple] = {}
+		self.strategies: list[tuple[AlgorithmStrategy, int]] = []
+		self.lock = threading.Lock()
+		self.n_ticks = 0
+
+	def register(self, strategy: AlgorithmStrategy, warmup: int = 20) -> None:
+		"""strategy ticks on every new tick from now on, once the history is at least warmup values long"""
+		strategy.tick_count = self.history_len()
+		self.strategies.append((strategy, warmup))
+
+	def unregister(self, strategy: AlgorithmStrategy) -> None:
+		self.strategies = [(s, warmup) for s, warmup in self.strategies if s is not strategy]
+
+	def push(self, name: str, value: float | tuple[float, float, float, float]) -> bool:
+		"""
+		new price or bar of a stock, a newer one replaces it until the tick is complete.
+		returns True when it completed a tick, that the strategies have ticked on
+		"""
+		with self.lock:
+			self.pending[self.stock_index[name]] = value
+			if len(self.pending) < len(self.stocks):
+				return False
+			self.commit()
+			return True
+
+	def push_tick(self, values: dict[str, float | tuple[float, float, float, float]]) -> None:
+		"""a whole tick at once, one value for every stock"""
+		if len(values) != len(self.stocks):
+			raise ValueError(f"{len(values)} values for {len(self.stocks)} stocks")
+		with self.lock:
+			self.pending = {self.stock_index[name]: value for name, value in values.items()}
+			self.commit()
+
+	def commit(self) -> None:
+		for i, value in self.pending.items():
+			self.stocks[i].append(value)
+		self.pending = {}
+		self.n_ticks += 1
+
+		history_len = self.history_len()
+		for strategy, warmup in self.strategies:
+			if history_len < warmup:
+				strategy.tick_count += 1
+			else:
+				strategy.tick()
+
+	def run(self, source: typing.Iterable[tuple[str, float | tuple]]) -> int:
+		"""pushes every event of source, until it ends. returns the number of ticks completed"""
+		n_ticks = self.n_ticks
+		for name, value in source:
+			self.push(name, value)
+		return self.n_ticks - n_ticks
+
+
+def parse_event(line: str, sep: str = ";") -> tuple[str, float | tuple[float, float, float, float]] | None:
+	"""name;price or name;open;high;low;close, None for blank lines"""
+	fields = line.strip().split(sep)
+	if len(fields) == 0 or fields[0] == "":
+		return None
+	if len(fields) == 2:
+		return fields[0], float(fields[1])
+	if len(fields) == 5:
+		return fields[0], tuple(float(f) for f in fields[1:])
+	raise ValueError(f"bad feed line {line!r}")
+
+
+def queue_source(q: queue.Queue, sentinel: typing.Any = None) -> typing.Iterator[tuple[str, float | tuple]]:
+	"""the events put in q, until sentinel"""
+	while True:
+		event = q.get()
+		if event is sentinel:
+			return
+		yield event
+
+
+def tail_source(
+		path: str,
+		stop: threading.Event = None,
+		poll: float = 0.2,
+		from_start: bool = False,
+		sep: str = ";"
+		) -> typing.Iterator[tuple[str, float | tuple]]:
+	"""the lines appended to path, polled every poll seconds until stop is set"""
+	if stop is None:
+		stop = threading.Event()
+	with open(path, "r") as f:
+		if not from_start:
+			f.seek(0, 2)
+		rest = ""
+		while True:
+			chunk = f.read()
+			if len(chunk) == 0:
+				if stop.is_set():
+					return
+				time.sleep(poll)
+				continue
+			lines = (rest + chunk).split("\n")
+			# a line is complete only when its newline has been written
+			rest = lines.pop()
+			for line in lines:
+				event = parse_event(line, sep)
+				if event is not None:
+					yield event
+
+
+def socket_source(host: str, port: int, sep: str = ";") -> typing.Iterator[tuple[str, float | tuple]]:
+	"""the lines sent on a tcp connection to host:port, until it is closed"""
+	with socket.create_connection((host, port)) as conn, conn.makefile("r") as f:
+		for line in f:
+			event = parse_event(line, sep)
+			if event is not None:
+				yield event
@@ -1,3 +1,4 @@
+import functools
 import random
 import typing
 
@@ -5,6 +6,180 @@ import numpy as np
 from matplotlib import pyplot as plt
 
 
+def window_bounds(ends: np.ndarray, from_time: int, to_time: int) -> tuple[np.ndarray, np.ndarray]:
+	lo = np.full(ends.shape, from_time) if from_time > 0 else ends + from_time + 1
+	hi = np.full(ends.shape, to_time) if to_time > 0 else ends + to_time + 1
+	if len(ends) > 0 and lo.min() < 0:
+		raise IndexError("window starts before the beginning of the history")
+	if len(ends) > 0 and (hi - lo).min() <= 0:
+		raise ValueError("empty window")
+	return lo, hi
+
+
+def rolling_average(past: np.ndarray, ends: np.ndarray, from_time: int = 0, to_time: int = -1) -> np.ndarray:
+	"""
+	vectorized BenchmarkStock.historical_average: the average of past[from_time:to_time] for every end index in ends,
+	with from_time and to_time relative to the end index when <= 0
+	"""
+	if len(ends) == 0:
+		return np.zeros(0)
+	lo, hi = window_bounds(ends, from_time, to_time)
+
+	# same prefix sums as RollingStats, so the averages are bit for bit the ones of the tick loop
+	prefix = np.concatenate(([0.0], np.cumsum(past)))
+	return (prefix[hi] - prefix[lo]) / (hi - lo)
+
+
+def rolling_extreme(past: np.ndarray, ends: np.ndarray, from_time: int = 0, to_time: int = -1, maximum: bool = False) -> np.ndarray:
+	"""vectorized BenchmarkStock.historical_min (or historical_max), from a sparse table like RollingStats"""
+	if len(ends) == 0:
+		return np.zeros(0)
+	lo, hi = window_bounds(ends, from_time, to_time)
+	fun = np.maximum if maximum else np.minimum
+	# level k of the table is the extreme of the 2^k long windows, indexed by their first element
+	levels = [np.asarray(past, dtype=np.float64)]
+	while (1 << len(levels)) <= int((hi - lo).max()):
+		half = 1 << (len(levels) - 1)
+		levels.append(fun(levels[-1][:-half], levels[-1][half:]))
+	k = np.frexp(hi - lo)[1] - 1
+	result = np.empty(len(ends))
+	for level in np.unique(k):
+		at = k == level
+		result[at] = fun(levels[level][lo[at]], levels[level][hi[at] - (1 << int(level))])
+	return result
+
+
+def rolling_trend(past: np.ndarray, ends: np.ndarray, from_time: int = -2, to_time: int = -1) -> np.ndarray:
+	"""vectorized BenchmarkStock.trend"""
+	index1 = np.full(ends.shape, from_time) if from_time > 0 else ends + from_time + 1
+	index2 = np.full(ends.shape, to_time) if to_time > 0 else ends + to_time + 1
+	if len(ends) == 0:
+		return np.zeros(0)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		return np.where(index1 != index2, (past[index1] - past[index2]) / (index1 - index2), 0.0)
+
+
+def min_max_downsample(x: np.ndarray, y: np.ndarray, n_out: int) -> tuple[np.ndarray, np.ndarray]:
+	"""the first and the last point, and the min and the max of every bucket in between, in their order"""
+	n = len(x)
+	if n <= n_out or n_out < 4:
+		return x, y
+	n_buckets = (n_out - 2) // 2
+	edges = np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+	bucket = np.repeat(np.arange(n_buckets), np.diff(edges))
+	# sorted by bucket then by value: the first of a bucket is its min, the last its max
+	order = np.lexsort((y[1:-1], bucket)) + 1
+	index = np.unique(np.concatenate(([0], order[edges[:-1] - 1], order[edges[1:] - 2], [n - 1])))
+	return x[index], y[index]
+
+
+def lttb_downsample(x: np.ndarray, y: np.ndarray, n_out: int) -> tuple[np.ndarray, np.ndarray]:
+	"""
+	largest triangle three buckets: the first and the last point, and in every bucket in between the point making
+	the largest triangle with the point kept in the previous bucket and the mean of the next bucket
+	"""
+	n = len(x)
+	if n <= n_out or n_out < 3:
+		return x, y
+	xf, yf = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+	edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+	lengths = np.diff(edges)
+	mean_x = np.add.reduceat(xf[:n - 1], edges[:-1]) / lengths
+	mean_y = np.add.reduceat(yf[:n - 1], edges[:-1]) / lengths
+
+	index = np.empty(n_out, dtype=np.int64)
+	index[0], index[-1] = 0, n - 1
+	a = 0
+	for k in range(n_out - 2):
+		lo, hi = edges[k], edges[k + 1]
+		cx, cy = (mean_x[k + 1], mean_y[k + 1]) if k + 1 < n_out - 2 else (xf[-1], yf[-1])
+		area = np.abs((xf[a] - cx) * (yf[lo:hi] - yf[a]) - (xf[a] - xf[lo:hi]) * (cy - yf[a]))
+		a = lo + int(np.argmax(area))
+		index[k + 1] = a
+	return x[index], y[index]
+
+
+downsamplers: dict[str, typing.Callable] = {
+	"lttb": lttb_downsample,
+	"minmax": min_max_downsample
+	}
+
+
+def downsample_series(x: np.ndarray, y: np.ndarray, n_out: int, method: str = None) -> tuple[np.ndarray, np.ndarray]:
+	"""about n_out points of the series, with downsamplers[method]. None keeps every point"""
+	if method is None:
+		return x, y
+	return downsamplers[method](np.asarray(x), np.asarray(y), n_out)
+
+
+class RollingStats:
+	"""
+	prefix sums and min/max sparse tables of a growing past, extended in place up to the last index queried:
+	every query is O(1) plus the amortized extension
+	"""
+
+	def __init__(self, past: list | np.ndarray):
+		self.past = past
+		# lists for a list past, numpy arrays for an array one
+		self.prefix: list | np.ndarray = [0]
+		self.mins: list[list | np.ndarray] = [[]]
+		self.maxs: list[list | np.ndarray] = [[]]
+
+	def extend_prefix(self, n: int) -> None:
+		if isinstance(self.past, np.ndarray):
+			# an array never grows: build it all at once, in the same order as the loop below
+			self.prefix = np.cumsum(np.concatenate(([0.0], self.past)))
+			return
+
+		for i in range(len(self.prefix) - 1, n):
+			self.prefix.append(self.prefix[-1] + self.past[i])
+
+	def extend_tables(self, n: int) -> None:
+		if isinstance(self.past, np.ndarray):
+			# all the levels at once, as arrays: level 0 is the past itself, a memory map is not copied
+			self.mins, self.maxs = [self.past], [self.past]
+			k = 1
+			while (1 << k) <= len(self.past):
+				half = 1 << (k - 1)
+				self.mins.append(np.minimum(self.mins[k - 1][:-half], self.mins[k - 1][half:]))
+				self.maxs.append(np.maximum(self.maxs[k - 1][:-half], self.maxs[k - 1][half:]))
+				k += 1
+			return
+
+		for i in range(len(self.mins[0]), n):
+			self.mins[0].append(self.past[i])
+			self.maxs[0].append(self.past[i])
+
+			# level k holds the min/max of the 2^k long windows, indexed by their first element
+			k = 1
+			while (1 << k) <= i + 1:
+				if len(self.mins) == k:
+					self.mins.append([])
+					self.maxs.append([])
+				j = i - (1 << k) + 1
+				half = 1 << (k - 1)
+				self.mins[k].append(min(self.mins[k - 1][j], self.mins[k - 1][j + half]))
+				self.maxs[k].append(max(self.maxs[k - 1][j], self.maxs[k - 1][j + half]))
+				k += 1
+
+	def average(self, lo: int, hi: int) -> float:
+		if hi >= len(self.prefix):
+			self.extend_prefix(hi)
+		return (self.prefix[hi] - self.prefix[lo]) / (hi - lo)
+
+	def min(self, lo: int, hi: int) -> float:
+		if hi > len(self.mins[0]):
+			self.extend_tables(hi)
+		k = (hi - lo).bit_length() - 1
+		return min(self.mins[k][lo], self.mins[k][hi - (1 << k)])
+
+	def max(self, lo: int, hi: int) -> float:
+		if hi > len(self.maxs[0]):
+			self.extend_tables(hi)
+		k = (hi - lo).bit_length() - 1
+		return max(self.maxs[k][lo], self.maxs[k][hi - (1 << k)])
+
+
 class Stock:
 	def __init__(self, name: str, past: list = None):
 		if past is None:
@@ -12,18 +187,33 @@ class Stock:
 
 		self.name: str = name
 		self.past: list = past
+		self.rolling: RollingStats = RollingStats(self.past)
 
 	def price(self) -> float:
 		return self.past[-1]
 
+	def settle_price(self) -> float:
+		"""the price trades are settled at, the price the decisions are taken on unless a market settles on another series"""
+		return self.price()
+
+	def window(self, from_time: int, to_time: int) -> tuple[int, int]:
+		"""absolute bounds of past[from_time:to_time]"""
+		if self.rolling.past is not self.past:
+			self.rolling = RollingStats(self.past)
+
+		lo, hi, _ = slice(from_time, to_time).indices(len(self.past))
+		if hi <= lo:
+			raise ValueError(f"empty window past[{from_time}:{to_time}]")
+		return lo, hi
+
 	def historical_average(self, from_time: int = 0, to_time: int = -1) -> float:
-		return sum(self.past[from_time:to_time]) / len(self.past[from_time:to_time])
+		return self.rolling.average(*self.window(from_time, to_time))
 
 	def historical_min(self, from_time: int = 0, to_time: int = -1) -> float:
-		return min(self.past[from_time:to_time])
+		return self.rolling.min(*self.window(from_time, to_time))
 
 	def historical_max(self, from_time: int = 0, to_time: int = -1) -> float:
-		return max(self.past[from_time:to_time])
+		return self.rolling.max(*self.window(from_time, to_time))
 
 	def trend(self, from_time: int = -2, to_time: int = -1) -> float:
 		index1 = from_time if from_time > 0 else len(self.past) + from_time
@@ -43,9 +233,20 @@ class Stock:
 
 class Market:
 	def __init__(self):
+		self.stock_index: dict[str, int] = {}
 		self.stocks: list = []
 
+	@property
+	def stocks(self) -> list:
+		return self._stocks
+
+	@stocks.setter
+	def stocks(self, stocks: list) -> None:
+		self._stocks = stocks
+		self.stock_index = {stock.name: i for i, stock in enumerate(stocks)}
+
 	def add_stock(self, stk: Stock) -> None:
+		self.stock_index[stk.name] = len(self.stocks)
 		self.stocks.append(stk)
 
 	def all_pasts(self) -> list[list]:
@@ -55,15 +256,31 @@ class Market:
 		return len(self.stocks[0].past)
 
 	def stock_by_name(self, name: str) -> Stock | None:
-		for stock in self.stocks:
-			if stock.name == name:
-				return stock
-		return None
+		return self.stocks[self.stock_index[name]] if name in self.stock_index else None
 
-	def gen_fig(self, names: list[str] = None, fig_index: int = 0) -> plt.Figure:
+	def current_prices(self) -> np.ndarray:
+		"""price of every stock, in the order of stocks"""
+		return np.array([stock.price() for stock in self.stocks], dtype=np.float64)
+
+	def settle_prices(self) -> np.ndarray:
+		"""settle price of every stock, in the order of stocks: the holdings are valued at it"""
+		return np.array([stock.settle_price() for stock in self.stocks], dtype=np.float64)
+
+	def gen_fig(
+			self,
+			names: list[str] = None,
+			fig_index: int = 0,
+			fig: plt.Figure = None,
+			downsample: str = None,
+			n_points: int = 2000
+			) -> plt.Figure:
+		"""
+		the prices of the stocks in names, all when empty. drawn on fig when given, otherwise on the pyplot figure
+		fig_index. with downsample (a key of downsamplers) every series is reduced to about n_points
+		"""
 		stocks_to_plot = []
 
-		if len(names) == 0 or names is None:
+		if names is None or len(names) == 0:
 			stocks_to_plot = self.stocks
 		else:
 			for s in self.stocks:
@@ -73,15 +290,73 @@ class Market:
 		time_len = self.history_len()
 		t = np.arange(0, time_len)
 
-		fig = plt.figure(fig_index)
+		if fig is None:
+			fig = plt.figure(fig_index)
 		ax = fig.subplots()
 		for s in stocks_to_plot:
-			ax.plot(t, s.past, label=s.name)
+			ax.plot(*downsample_series(t, s.past, n_points, downsample), label=s.name)
 		fig.legend(loc="center right")
 		fig.set_figwidth(10)
 		return fig
 
 
+def trend_model(rng: np.random.Generator, shape: tuple[int, int], time_len: int) -> np.ndarray:
+	"""
+	the SimStock model: every step adds the mean fluctuation so far times U(-6, 6) plus U(trend, stability),
+	with trend and stability drawn once per stock of every path
+	"""
+	trend = rng.uniform(-6, 6, shape)
+	stability = rng.uniform(-2, 2, shape)
+	# time first, so every step writes a contiguous block
+	x = np.empty((time_len,) + shape)
+	x[0] = rng.integers(10, 501, shape)
+	for t in range(1, time_len):
+		mean_fluct = (x[t - 1] - x[0]) / t
+		x[t] = x[t - 1] + mean_fluct * rng.uniform(-6, 6, shape) + trend + (stability - trend) * rng.random(shape)
+	return np.ascontiguousarray(np.moveaxis(x, 0, -1))
+
+
+def gbm_model(
+		rng: np.random.Generator,
+		shape: tuple[int, int],
+		time_len: int,
+		mu: float | np.ndarray = 0.0003,
+		sigma: float | np.ndarray = 0.02,
+		start: tuple[float, float] = (10, 500),
+		jump_rate: float = 0,
+		jump_mean: float = 0,
+		jump_std: float = 0
+		) -> np.ndarray:
+	"""
+	geometric brownian motion of drift mu and volatility sigma per step (floats or one per stock), from a price
+	uniform in start. with jump_rate > 0 a poisson number of jumps per step, each of lognormal size (merton)
+	"""
+	mu, sigma = np.asarray(mu, dtype=np.float64)[..., None], np.asarray(sigma, dtype=np.float64)[..., None]
+	log_steps = (mu - sigma ** 2 / 2) + sigma * rng.standard_normal(shape + (time_len - 1,))
+	if jump_rate > 0:
+		n_jumps = rng.poisson(jump_rate, log_steps.shape)
+		log_steps += n_jumps * jump_mean + np.sqrt(n_jumps) * jump_std * rng.standard_normal(log_steps.shape)
+
+	x = np.empty(shape + (time_len,))
+	x[..., 0] = 0
+	np.cumsum(log_steps, axis=-1, out=x[..., 1:])
+	np.exp(x, out=x)
+	x *= rng.uniform(start[0], start[1], shape)[..., None]
+	return x
+
+
+sim_models: dict[str, typing.Callable] = {
+	"trend": trend_model,
+	"gbm": gbm_model,
+	"jump": functools.partial(gbm_model, jump_rate=0.01, jump_mean=-0.03, jump_std=0.08)
+	}
+
+
+def sim_paths(n_paths: int, n_stocks: int, time_len: int, seed: int = None, model: str = "trend", **kwargs) -> np.ndarray:
+	"""(n_paths, n_stocks, time_len) prices of sim_models[model], the same for the same seed"""
+	return sim_models[model](np.random.default_rng(seed), (n_paths, n_stocks), time_len, **kwargs)
+
+
 class SimStock(Stock):
 	def __init__(self, i=0):
 		super().__init__(f"sim-{i}", [random.randint(10, 500)])
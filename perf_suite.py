@@ -0,0 +1,212 @@
+"""
+speed of the project, not the profit of the strategies: every case is timed best of repeat runs and written as json,
+then compared with a baseline json. a case slower than the baseline by more than threshold is a regression.
+
+	python perf_suite.py --out perf.json --baseline perf_baseline.json --threshold 0.2
+	python perf_suite.py --quick --save-baseline perf_baseline.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import subprocess
+import sys
+import time
+import typing
+
+import numpy as np
+
+import alg
+from alg_benchmark import MarketBenchmark
+from alg_best_fitter import best_fitting_params_fun, implements
+from market import SimMarket, sim_paths
+
+strategies: dict[str, tuple[typing.ClassVar, list]] = {
+	"AllInAllOut": (alg.AllInAllOut, [4, -0.1, 0.2, -10]),
+	"OneInAllOut": (alg.OneInAllOut, [1, 0.5, 0.3, -8])
+	}
+
+
+def timed(fun: typing.Callable, repeat: int) -> float:
+	"""best time of repeat calls of fun, the output of fun is discarded"""
+	best = float("inf")
+	for _ in range(repeat):
+		with contextlib.redirect_stdout(io.StringIO()):
+			t = time.perf_counter()
+			fun()
+			best = min(best, time.perf_counter() - t)
+	return best
+
+
+def case(seconds: float, n: int, unit: str) -> dict[str, typing.Any]:
+	return {'seconds': seconds, 'n': n, 'unit': unit, 'rate': n / seconds if seconds > 0 else float("inf")}
+
+
+def synthetic_universe(n_stocks: int, time_len: int) -> str:
+	"""a shared scenario of n_stocks gbm stocks, the same every run"""
+	return MarketBenchmark.share_paths(sim_paths(1, n_stocks, time_len, seed=0, model="gbm"), prefix=f"perf/{n_stocks}x{time_len}")[0]
+
+
+def bench_load(scenarios: list[str], repeat: int) -> dict[str, dict]:
+	results = {}
+	for scenario in scenarios:
+		source, _ = MarketBenchmark.scenario_source(scenario)
+
+		def load():
+			MarketBenchmark.scenario_cache.clear()
+			MarketBenchmark().load_scenario(scenario)
+
+		benchmark = MarketBenchmark()
+		benchmark.load_scenario(scenario)
+		results[f"load/{scenario}/{source}"] = case(timed(load, repeat), benchmark.prices.size, "prices")
+	return results
+
+
+def bench_tick(scenarios: list[str], repeat: int, start: int = 20) -> dict[str, dict]:
+	results = {}
+	for scenario in scenarios:
+		benchmark = MarketBenchmark()
+		benchmark.load_scenario(scenario)
+		n_ticks = benchmark.prices.shape[1] - 1 - start
+		for name, (alg_class, params) in strategies.items():
+			def run():
+				benchmark.load_scenario(scenario, start=start)
+				a = alg_class(benchmark, start_capital=0, params=params)
+				a.tick_count = start
+				a.disable_log()
+				benchmark.cycle(a.tick)
+
+			results[f"tick/{name}/{scenario}"] = case(timed(run, repeat), n_ticks * len(benchmark.stocks), "stock ticks")
+	return results
+
+
+def bench_stats(scenarios: list[str], repeat: int) -> dict[str, dict]:
+	results = {}
+	for scenario in scenarios:
+		benchmark = MarketBenchmark()
+		for name, (alg_class, params) in strategies.items():
+			funs = {"loop": MarketBenchmark.stats_of_benchmark}
+			if implements(alg_class, "vectorized_moves"):
+				funs["vectorized"] = MarketBenchmark.vectorized_stats_of_benchmark
+			for fun_name, fun in funs.items():
+				def run():
+					fun(benchmark, alg_class=alg_class, scenario=scenario, params=params)
+
+				results[f"stats/{fun_name}/{name}/{scenario}"] = case(timed(run, repeat), 1, "benchmarks")
+	return results
+
+
+def bench_sweep(scenario: str, grids: list[list[int]], workers: list[int], repeat: int) -> dict[str, dict]:
+	results = {}
+	bounds = [(1, 1), (-5, 5), (-5, 5), (-15, -2)]
+	funs = {
+		"loop": MarketBenchmark.stats_of_benchmark,
+		"vectorized": MarketBenchmark.vectorized_stats_of_benchmark,
+		"batched": MarketBenchmark.batched_stats_of_benchmark
+		}
+	for iterations in grids:
+		size = int(np.prod(iterations))
+		for processes in workers:
+			for fun_name, fun in funs.items():
+				def run():
+					best_fitting_params_fun(fun, alg.OneInAllOut, bounds, iterations, scenario, threading_scale=processes)
+
+				name = f"sweep/{fun_name}/{size}/{processes}p/{scenario}"
+				results[name] = case(timed(run, repeat), size, "params")
+	return results
+
+
+def bench_sim(sizes: list[tuple[int, int, int]], repeat: int) -> dict[str, dict]:
+	results = {}
+	for n_paths, n_stocks, time_len in sizes:
+		results[f"sim/SimMarket/{n_stocks}x{time_len}"] = case(
+			timed(lambda: SimMarket(past_time_len=time_len, n_stocks=n_stocks), repeat), n_stocks * time_len, "prices"
+			)
+		for model in ["trend", "gbm"]:
+			results[f"sim/{model}/{n_paths}x{n_stocks}x{time_len}"] = case(
+				timed(lambda: sim_paths(n_paths, n_stocks, time_len, seed=0, model=model), repeat), n_paths * n_stocks * time_len, "prices"
+				)
+	return results
+
+
+def run_suite(quick: bool = False, repeat: int = 3) -> dict[str, typing.Any]:
+	scenarios = ["current", "all_time"]
+	universes = [synthetic_universe(50, 2500)] if quick else [synthetic_universe(50, 2500), synthetic_universe(200, 5000)]
+	grids = [[1, 4, 4, 2]] if quick else [[1, 4, 4, 2], [1, 10, 10, 4]]
+	workers = sorted({1, mp.cpu_count()})
+
+	results = {}
+	results.update(bench_load(scenarios, repeat))
+	results.update(bench_tick(scenarios + universes[:1], repeat))
+	results.update(bench_stats(scenarios + universes, repeat))
+	results.update(bench_sweep("current", grids, workers, repeat))
+	results.update(bench_sim([(100, 10, 1000)] if quick else [(100, 10, 1000), (1000, 10, 2500)], repeat))
+	return {'meta': machine_info(), 'results': results}
+
+
+def machine_info() -> dict[str, typing.Any]:
+	try:
+		commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+	except OSError:
+		commit = ""
+	return {
+		'time': time.strftime("%Y/%m/%d_%H:%M:%S"),
+		'commit': commit,
+		'python': platform.python_version(),
+		'numpy': np.__version__,
+		'machine': platform.machine(),
+		'cpus': mp.cpu_count()
+		}
+
+
+def compare(results: dict[str, typing.Any], baseline: dict[str, typing.Any], threshold: float = 0.2) -> list[tuple[str, float, float]]:
+	"""(case, baseline seconds, seconds) of the cases slower than the baseline by more than threshold"""
+	regressions = []
+	for name, r in results['results'].items():
+		if name not in baseline['results']:
+			continue
+		before = baseline['results'][name]['seconds']
+		if r['seconds'] > before * (1 + threshold):
+			regressions.append((name, before, r['seconds']))
+	return regressions
+
+
+def print_results(results: dict[str, typing.Any], baseline: dict[str, typing.Any] = None) -> None:
+	for name, r in results['results'].items():
+		line = f"{name:<48}{r['seconds']:>10.4f}s{r['rate']:>16.1f} {r['unit']}/s"
+		if baseline is not None and name in baseline['results']:
+			line += f"\t{r['seconds'] / baseline['results'][name]['seconds'] - 1:+.1%}"
+		print(line)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="performance suite")
+	parser.add_argument("--out", default="perf.json")
+	parser.add_argument("--baseline", default=None, help="json of a previous run to compare with")
+	parser.add_argument("--save-baseline", default=None, help="also write the results as the new baseline")
+	parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+	parser.add_argument("--repeat", type=int, default=3)
+	parser.add_argument("--quick", action="store_true", help="smaller universes and grids")
+	args = parser.parse_args()
+
+	suite = run_suite(quick=args.quick, repeat=args.repeat)
+	with open(args.out, "w+") as f:
+		json.dump(suite, f, indent="\t")
+	if args.save_baseline is not None:
+		with open(args.save_baseline, "w+") as f:
+			json.dump(suite, f, indent="\t")
+
+	base = None
+	if args.baseline is not None and os.path.exists(args.baseline):
+		with open(args.baseline, "r") as f:
+			base = json.load(f)
+	print_results(suite, base)
+
+	if base is not None:
+		slower = compare(suite, base, args.threshold)
+		for case_name, before, after in slower:
+			print(f"regression {case_name}: {before:.4f}s -> {after:.4f}s")
+		sys.exit(1 if len(slower) > 0 else 0)
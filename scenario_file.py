@@ -0,0 +1,93 @@
+"""
+binary scenarios: ./scenarios/<scenario>.scn next to the text directory ./scenarios/<scenario>/
+
+	magic (8 bytes) | header length (uint64) | json header, padded to 64 bytes |
+	float64 prices, one contiguous column per stock | int64 timestamps (optional)
+
+the header has the stock names, the number of ticks and whether there are timestamps.
+read_scenario memory maps the file, so the prices of a stock are a zero-copy view shared through the page cache
+"""
+import json
+import os
+
+import numpy as np
+
+MAGIC = b"FINSCN01"
+ALIGN = 64
+EXTENSION = ".scn"
+
+
+def scenario_path(scenario: str, scenarios_dir: str = "./scenarios") -> str:
+	return f"{scenarios_dir}/{scenario}{EXTENSION}"
+
+
+def write_scenario(path: str, names: list[str], prices: np.ndarray, timestamps: np.ndarray = None) -> None:
+	prices = np.ascontiguousarray(prices, dtype=np.float64).reshape(len(names), -1)
+	if timestamps is not None and len(timestamps) != prices.shape[1]:
+		raise ValueError(f"{len(timestamps)} timestamps for {prices.shape[1]} ticks")
+
+	header = json.dumps({'names': list(names), 'n_ticks': prices.shape[1], 'timestamps': timestamps is not None}).encode()
+	data_offset = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+	# written aside and renamed, so a reader never maps a half written file
+	tmp_path = f"{path}.tmp{os.getpid()}"
+	with open(tmp_path, "wb") as f:
+		f.write(MAGIC)
+		f.write(np.uint64(len(header)).tobytes())
+		f.write(header)
+		f.write(b"\0" * (data_offset - len(MAGIC) - 8 - len(header)))
+		f.write(prices.tobytes())
+		if timestamps is not None:
+			f.write(np.ascontiguousarray(timestamps, dtype=np.int64).tobytes())
+	os.replace(tmp_path, path)
+
+
+def read_scenario(path: str) -> tuple[list[str], np.ndarray, np.ndarray | None]:
+	"""stock names, (n_stocks, n_ticks) read-only memory map of the prices and the timestamps if the file has them"""
+	with open(path, "rb") as f:
+		if f.read(len(MAGIC)) != MAGIC:
+			raise ValueError(f"{path} is not a binary scenario")
+		header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+		header = json.loads(f.read(header_len))
+	data_offset = -(-(len(MAGIC) + 8 + header_len) // ALIGN) * ALIGN
+
+	names = header['names']
+	shape = (len(names), header['n_ticks'])
+	if shape[0] * shape[1] == 0:
+		return names, np.zeros(shape), np.zeros(shape[1], dtype=np.int64) if header['timestamps'] else None
+
+	prices = np.memmap(path, dtype=np.float64, mode="r", offset=data_offset, shape=shape)
+	timestamps = None
+	if header['timestamps']:
+		timestamps = np.memmap(path, dtype=np.int64, mode="r", offset=data_offset + prices.nbytes, shape=(shape[1],))
+	return names, prices, timestamps
+
+
+def convert_scenario(scenario: str, scenarios_dir: str = "./scenarios") -> str:
+	"""writes the binary file of the text scenario directory, with the stocks in the order load_scenario reads them"""
+	stock_dir = f"{scenarios_dir}/{scenario}"
+	names, pasts = [], []
+	for file in os.listdir(stock_dir):
+		with open(f"{stock_dir}/{file}", "r") as f:
+			pasts.append([float(line.rstrip()) for line in f.readlines() if len(line.rstrip()) > 0])
+		names.append(file)
+
+	path = scenario_path(scenario, scenarios_dir)
+	write_scenario(path, names, np.array(pasts, dtype=np.float64))
+	return path
+
+
+def convert_all(scenarios_dir: str = "./scenarios") -> list[str]:
+	"""converts every directory of text stock files under scenarios_dir"""
+	converted = []
+	for root, dirs, files in os.walk(scenarios_dir):
+		if len(dirs) > 0 or len(files) == 0 or any("." in file for file in files):
+			continue
+		scenario = os.path.relpath(root, scenarios_dir).replace(os.sep, "/")
+		converted.append(convert_scenario(scenario, scenarios_dir))
+		print(f"converted {scenario}")
+	return converted
+
+
+if __name__ == '__main__':
+	convert_all()